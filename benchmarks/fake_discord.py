@@ -0,0 +1,249 @@
+import asyncio
+import itertools
+from datetime import datetime, timezone
+import discord
+from bot import PlayBot
+
+
+class FakeRole:
+    def __init__(self, id: int, name: str, guild=None):
+        self.id = id
+        self.name = name
+        self.guild = guild
+
+
+class FakeUser:
+    def __init__(self, id: int, name: str, roles=None):
+        self.id = id
+        self.name = name
+        self.roles = list(roles or [])
+        self.bot = False
+
+    def __eq__(self, other) -> bool:
+        return getattr(other, 'id', None) == self.id
+
+    def __hash__(self) -> int:
+        return hash(self.id)
+
+
+class FakeReaction:
+    def __init__(self, emoji: str, count: int = 0):
+        self.emoji = emoji
+        self.count = count
+
+
+class FakePayload:
+    """
+    Stand-in for discord.RawReactionActionEvent
+    """
+
+    def __init__(self, message, user_id: int, emoji: str):
+        self.message_id = message.id
+        self.channel_id = message.channel.id
+        self.guild_id = message.guild.id if message.guild else None
+        self.user_id = user_id
+        self.emoji = emoji
+
+
+class FakeMessage:
+    def __init__(self, world, channel, author, content=None, embed=None, reference=None, id: int = None):
+        self.world = world
+        self.id = id or world.snowflake()
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content or ""
+        self.embed = embed
+        self.reference = reference
+        self.reactions = []
+        self.edits = 0
+
+    async def add_reaction(self, emoji: str):
+        self.world.react(self, self.world.client_user.id, str(emoji))
+
+    async def edit(self, **kwargs):
+        self.edits += 1
+        if 'content' in kwargs:
+            self.content = kwargs['content']
+        if 'embed' in kwargs:
+            self.embed = kwargs['embed']
+        return self
+
+    @property
+    def jump_url(self) -> str:
+        guild_id = self.guild.id if self.guild else '@me'
+        return 'https://discord.com/channels/' + str(guild_id) + '/' + str(self.channel.id) + '/' + str(self.id)
+
+    def to_reference(self) -> tuple:
+        return (self.guild.id if self.guild else None, self.channel.id, self.id)
+
+
+class FakeChannel:
+    def __init__(self, world, id: int, guild=None):
+        self.world = world
+        self.id = id
+        self.guild = guild
+        self.messages = {}
+        self.sent = 0
+
+    async def send(self, content=None, embed=None, reference=None, allowed_mentions=None):
+        self.sent += 1
+        self.world.api_calls += 1
+        msg = FakeMessage(self.world, self, self.world.client_user, content, embed, reference)
+        if self.world.keep_messages:
+            self.messages[msg.id] = msg
+        return msg
+
+    def get_partial_message(self, id: int):
+        """
+        Like discord.py this doesn't check the message exists, an unknown id gets an empty shell
+        """
+        msg = self.messages.get(id)
+        if msg is None:
+            msg = FakeMessage(self.world, self, self.world.client_user, id=id)
+        return msg
+
+    async def fetch_message(self, id: int):
+        self.world.api_calls += 1
+        msg = self.messages.get(id)
+        if msg is None:
+            raise discord.NotFound(FakeResponse(404, "Not Found"), "Unknown Message")
+        return msg
+
+
+class FakeResponse:
+    """
+    Just enough of an aiohttp response to build discord.HTTPException errors
+    """
+
+    def __init__(self, status: int, reason: str):
+        self.status = status
+        self.reason = reason
+
+
+class FakeGuild:
+    def __init__(self, id: int, name: str):
+        self.id = id
+        self.name = name
+        self.unavailable = False
+        self.roles = []
+        self.text_channels = []
+
+
+class FakeWorld:
+    """
+    A tiny in-memory discord: guilds, channels, messages and reactions
+
+    Anything the bot sends lands in here instead of going over the network,
+    and reactions made through `react` are handed to the attached bot the same
+    way the gateway would
+    """
+
+    def __init__(self, keep_messages: bool = True):
+        """
+        Args:
+            keep_messages (bool): keep what the bot sends so it can be fetched later,
+                off means anything still alive is being held by the bot
+        """
+        self.keep_messages = keep_messages
+        self.__ids = itertools.count(1)
+        self.guilds = {}
+        self.channels = {}
+        self.users = {}
+        self.client = None
+        self.client_user = FakeUser(self.snowflake(), "PlayBot")
+        self.api_calls = 0
+
+    def snowflake(self) -> int:
+        """
+        Returns:
+            int: a unique id that carries the current time like a real snowflake
+        """
+        now = discord.utils.time_snowflake(datetime.now(timezone.utc))
+        return now + next(self.__ids) % (1 << 22)
+
+    def add_guild(self, name: str = "guild", channels: int = 1) -> FakeGuild:
+        guild = FakeGuild(self.snowflake(), name)
+        guild.roles.append(FakeRole(guild.id, "@everyone", guild))
+        for _ in range(channels):
+            channel = FakeChannel(self, self.snowflake(), guild)
+            guild.text_channels.append(channel)
+            self.channels[channel.id] = channel
+        self.guilds[guild.id] = guild
+        return guild
+
+    def add_role(self, guild: FakeGuild, name: str) -> FakeRole:
+        role = FakeRole(self.snowflake(), name, guild)
+        guild.roles.append(role)
+        return role
+
+    def add_user(self, name: str = "user", roles=None) -> FakeUser:
+        user = FakeUser(self.snowflake(), name, roles)
+        self.users[user.id] = user
+        return user
+
+    def message(self, channel: FakeChannel, author: FakeUser, content: str) -> FakeMessage:
+        """
+        A message written by a user, what the bot sees in `on_message`
+        """
+        msg = FakeMessage(self, channel, author, content)
+        if self.keep_messages:
+            channel.messages[msg.id] = msg
+        return msg
+
+    def react(self, message: FakeMessage, user_id: int, emoji: str) -> FakePayload:
+        """
+        Adds a reaction and lets the attached bot know about it
+
+        Returns:
+            FakePayload: the raw event the bot gets
+        """
+        for reaction in message.reactions:
+            if reaction.emoji == emoji:
+                reaction.count += 1
+                break
+        else:
+            message.reactions.append(FakeReaction(emoji, 1))
+        payload = FakePayload(message, user_id, emoji)
+        if self.client:
+            asyncio.get_event_loop().create_task(self.client.on_raw_reaction_add(payload))
+        return payload
+
+
+class FakePlayBot(PlayBot):
+    """
+    PlayBot wired to a FakeWorld instead of a gateway connection
+    """
+
+    def __init__(self, world: FakeWorld, **kwargs):
+        super().__init__(**kwargs)
+        self.world = world
+        world.client = self
+
+    @property
+    def user(self):
+        return self.world.client_user
+
+    @property
+    def guilds(self) -> list:
+        return list(self.world.guilds.values())
+
+    def get_channel(self, id: int):
+        return self.world.channels.get(id)
+
+    def get_guild(self, id: int):
+        return self.world.guilds.get(id)
+
+
+async def settle(bot: PlayBot, rounds: int = 3):
+    """
+    Lets the event loop run until nothing is left in the bot's outbound queue
+
+    Args:
+        bot (PlayBot): bot to wait on
+        rounds (int): how many quiet passes in a row count as settled
+    """
+    quiet = 0
+    while quiet < rounds:
+        await asyncio.sleep(0)
+        quiet = 0 if len(bot.outbound) else quiet + 1
@@ -0,0 +1,425 @@
+"""
+Benchmarks PlayBot against the in-memory discord in `fake_discord`
+
+Run from the repo root:
+    python -m benchmarks.run --out results.json
+
+Everything is written out as JSON so two runs (EG: before and after a change)
+can be diffed or compared by a script
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+import discord
+import pytz
+from outbound import OutboundQueue
+from ratelimit import KeyedLimiter
+from message_manager import BOT_TIME_ZONE
+from storage import PickleStore, SCHEMA_VERSION, EVENT_FIELDS, LEGACY_FORMAT, legacy_stamp
+from benchmarks.fake_discord import FakeWorld, FakePlayBot, FakePayload, settle
+
+# the fake discord doesn't rate limit, so neither should the bot
+UNLIMITED = (10 ** 9, 1.0)
+# a day out so nothing resolves while being measured
+FAR_EVENT = "!play 1:0:0"
+# settle every so often so the outbound queue doesn't balloon while opening events
+BATCH = 500
+
+
+class Bench:
+    """
+    One bot hooked up to a fresh fake world with a guild, an admin and a player
+    """
+
+    def __init__(
+            self, store_dir: str, backend: str = 'pickle', world: FakeWorld = None,
+            keep_messages: bool = True, limited: bool = False):
+        if world is None:
+            world = FakeWorld(keep_messages)
+            self.guild = world.add_guild(channels=4)
+            self.admin_role = world.add_role(self.guild, "admin")
+            self.admin = world.add_user("admin", [self.admin_role])
+            self.player = world.add_user("player")
+        self.world = world
+        self.bot = FakePlayBot(world)
+        self.bot.outbound = OutboundQueue(UNLIMITED, UNLIMITED, self.bot.metrics)
+        self.bot.pings.outbound = self.bot.outbound
+        if not limited:
+            # everything comes from the same couple of users, so no command limits either
+            self.bot.limits = tuple((scope, KeyedLimiter(*UNLIMITED)) for scope, _ in self.bot.limits)
+            self.bot.max_open_events = 10 ** 9
+        # partitions open their save files lazily, so this only has to happen before the first event
+        self.bot.save_backend = backend
+        self.bot.file = os.path.join(store_dir, "bench.p")
+        self.bot.db_file = os.path.join(store_dir, "bench.db")
+
+    def setup_guild(self):
+        for guild in self.bot.guilds:
+            self.bot.index_guild_roles(guild)
+        self.bot.permit_role(self.admin_role.id, True, self.guild.id)
+        # high enough that nothing passes while being measured
+        self.bot.set_config('threshold', 10 ** 6, self.guild.id)
+
+    def channel(self, i: int):
+        channels = self.guild.text_channels
+        return channels[i % len(channels)]
+
+    async def open_events(self, count: int):
+        """
+        Opens events the way users would, through `on_message`
+        """
+        for i in range(count):
+            await self.bot.on_message(self.world.message(self.channel(i), self.player, FAR_EVENT))
+            if i % BATCH == BATCH - 1:
+                await settle(self.bot)
+        await settle(self.bot)
+
+    def close(self):
+        # nothing left for __del__ to write once the temp dir is gone
+        if self.bot.is_dirty():
+            self.bot.try_saving()
+
+
+def percentiles(samples: list) -> dict:
+    """
+    Helper that summarizes latencies, in microseconds
+    """
+    ordered = sorted(samples)
+
+    def at(p):
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1e6, 2)
+    return {
+        'mean_us': round(statistics.mean(ordered) * 1e6, 2),
+        'p50_us': at(0.50),
+        'p90_us': at(0.90),
+        'p99_us': at(0.99),
+        'max_us': round(ordered[-1] * 1e6, 2)
+    }
+
+
+async def bench_on_message(store_dir: str, messages: int) -> dict:
+    """
+    Command throughput with a realistic mix of commands and chatter
+    """
+    bench = Bench(store_dir)
+    bench.setup_guild()
+    mix = [
+        (bench.player, FAR_EVENT),
+        (bench.player, "!play help"),
+        (bench.admin, "!play count 1000000"),
+        (bench.player, "!play count 5"),
+        (bench.player, "!play not:a:time"),
+        (bench.player, "just talking about !play"),
+        (bench.player, "!playing something else"),
+        (bench.admin, "!play ping " + str(bench.admin_role.id)),
+    ]
+    msgs = []
+    for i in range(messages):
+        author, content = mix[i % len(mix)]
+        msgs.append(bench.world.message(bench.channel(i), author, content))
+    start = time.perf_counter()
+    for i, msg in enumerate(msgs):
+        await bench.bot.on_message(msg)
+        if i % BATCH == BATCH - 1:
+            await settle(bench.bot)
+    dispatched = time.perf_counter() - start
+    await settle(bench.bot)
+    total = time.perf_counter() - start
+    bench.close()
+
+    # one user spamming events with the real limits, everything past the burst gets dropped
+    spam = Bench(store_dir, limited=True)
+    spam.setup_guild()
+    msgs = [spam.world.message(spam.channel(0), spam.player, FAR_EVENT) for _ in range(messages)]
+    start = time.perf_counter()
+    for msg in msgs:
+        await spam.bot.on_message(msg)
+    spam_dispatched = time.perf_counter() - start
+    await settle(spam.bot)
+    spam.close()
+    return {
+        'messages': messages,
+        'dispatch_s': round(dispatched, 4),
+        'total_s': round(total, 4),
+        'messages_per_s': round(messages / total, 1),
+        'api_calls': bench.world.api_calls,
+        'open_events': len(bench.bot.running_msgs),
+        'spam_dispatch_s': round(spam_dispatched, 4),
+        'spam_api_calls': spam.world.api_calls,
+        'spam_open_events': len(spam.bot.running_msgs)
+    }
+
+
+async def bench_reactions(store_dir: str, events: int, samples: int) -> dict:
+    """
+    How long `on_raw_reaction_add` takes with `events` events open
+    """
+    bench = Bench(store_dir)
+    bench.setup_guild()
+    await bench.open_events(events)
+    posted = [rmsg.get_msg() for rmsg in bench.bot.running_msgs]
+    emoji = bench.bot.get_config(bench.guild.id).reaction_str
+    rand = random.Random(events)
+    payloads = [FakePayload(rand.choice(posted), bench.player.id, emoji) for _ in range(samples)]
+    # reactions on messages the bot doesn't know about are the common case in a busy guild
+    strangers = [FakePayload(bench.world.message(bench.channel(i), bench.player, "hi"), bench.player.id, emoji) for i in range(samples)]
+    hits = []
+    misses = []
+    for hit, miss in zip(payloads, strangers):
+        start = time.perf_counter()
+        await bench.bot.on_raw_reaction_add(hit)
+        hits.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        await bench.bot.on_raw_reaction_add(miss)
+        misses.append(time.perf_counter() - start)
+    bench.close()
+    return {
+        'events': events,
+        'samples': samples,
+        'tracked': percentiles(hits),
+        'untracked': percentiles(misses)
+    }
+
+
+async def bench_resolutions(store_dir: str, events: int) -> dict:
+    """
+    Discord calls made when every open event passes at the same moment, with and without merging pings
+    """
+    result = {'events': events}
+    # kept until the end, a bot that gets collected mid-run takes its scheduler tasks with it
+    benches = []
+    for name, window in (('unbatched', 0), ('batched', 0.05)):
+        bench = Bench(store_dir)
+        benches.append(bench)
+        bench.setup_guild()
+        bench.bot.pings.window = window
+        await bench.open_events(events)
+        rmsgs = list(bench.bot.running_msgs)
+        calls = bench.world.api_calls
+        start = time.perf_counter()
+        for rmsg in rmsgs:
+            rmsg.threshold = 0
+            rmsg.expire_now()
+        while not all(rmsg.is_complete() for rmsg in rmsgs) or len(bench.bot.pings) or len(bench.bot.outbound):
+            await asyncio.sleep(0.001)
+        result[name + '_s'] = round(time.perf_counter() - start, 4)
+        result[name + '_api_calls'] = bench.world.api_calls - calls
+        bench.close()
+    return result
+
+
+async def bench_save_load(store_dir: str, events: int, backend: str) -> dict:
+    """
+    Save and load time against the number of open events
+    """
+    # a database left by a smaller run would be loaded back in too
+    store_dir = tempfile.mkdtemp(dir=store_dir)
+    bench = Bench(store_dir, backend)
+    bench.setup_guild()
+    await bench.open_events(events)
+    start = time.perf_counter()
+    bench.bot.try_saving()
+    save = time.perf_counter() - start
+    size = sum(partition.store.size() for partition in bench.bot.all_partitions())
+
+    # a second bot loading what the first saved, like a restart
+    loaded = Bench(store_dir, backend, bench.world)
+    start = time.perf_counter()
+    loaded.bot.try_loading()
+    load = time.perf_counter() - start
+    while loaded.bot.rehydrate_time is None:
+        await asyncio.sleep(0)
+
+    # same restart with every saved message fetched up front
+    eager = Bench(store_dir, backend, bench.world)
+    eager.bot.try_loading()
+    # the rehydrate task only reads the window once it gets to run
+    eager.bot.rehydrate_window = eager.bot.max_event_time
+    while eager.bot.rehydrate_time is None:
+        await asyncio.sleep(0)
+    bench.close()
+    loaded.close()
+    eager.close()
+    return {
+        'backend': backend,
+        'events': events,
+        'save_s': round(save, 4),
+        'bytes': size,
+        'load_s': round(load, 4),
+        'rehydrate_s': round(loaded.bot.rehydrate_time, 4),
+        'eager_rehydrate_s': round(eager.bot.rehydrate_time, 4),
+        'loaded_events': len(loaded.bot.running_msgs)
+    }
+
+
+async def bench_idle(store_dir: str, events: int, seconds: float) -> dict:
+    """
+    CPU burnt while nothing is happening but `events` events are scheduled
+    """
+    bench = Bench(store_dir)
+    bench.setup_guild()
+    await bench.open_events(events)
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    await asyncio.sleep(seconds)
+    cpu = time.process_time() - cpu
+    wall = time.perf_counter() - wall
+    bench.close()
+    return {
+        'events': events,
+        'scheduled': bench.bot.scheduled_timers(),
+        'wall_s': round(wall, 3),
+        'cpu_s': round(cpu, 4),
+        'cpu_fraction': round(cpu / wall, 5)
+    }
+
+
+async def bench_memory(store_dir: str, events: int) -> dict:
+    """
+    Memory the bot holds per open event
+
+    The fake discord doesn't keep what gets sent here, so whatever is
+    still alive afterwards is held by the bot
+    """
+    bench = Bench(store_dir, keep_messages=False)
+    bench.setup_guild()
+    # warm up whatever gets allocated once, EG: caches and the first lane of the outbound queue
+    await bench.open_events(1)
+    ignore = (tracemalloc.Filter(False, tracemalloc.__file__),)
+    tracemalloc.start()
+    try:
+        gc.collect()
+        before = tracemalloc.take_snapshot().filter_traces(ignore)
+        await bench.open_events(events)
+        # finished sends leave reference cycles behind that only the collector frees
+        gc.collect()
+        after = tracemalloc.take_snapshot().filter_traces(ignore)
+    finally:
+        tracemalloc.stop()
+    held = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    bench.close()
+    return {
+        'events': events,
+        'bytes': held,
+        'bytes_per_event': round(held / events, 1)
+    }
+
+
+async def bench_load_schema(store_dir: str, events: int) -> dict:
+    """
+    Load time of a version 1 save file (dictionaries with a 'delay' and an
+    'offline_since' string) against the same events saved as records
+    """
+    store_dir = tempfile.mkdtemp(dir=store_dir)
+    world = FakeWorld()
+    guild = world.add_guild(channels=4)
+    stamp = datetime.now(pytz.timezone(BOT_TIME_ZONE)).strftime(LEGACY_FORMAT)
+    now = time.time()
+    records = [
+        (world.snowflake(), guild.id, guild.text_channels[i % 4].id, now + 60 * 60 + i, 4, False, "⚽", "ping", "failed")
+        for i in range(events)
+    ]
+    legacy = [
+        dict(zip(EVENT_FIELDS[:3], record[:3]), delay=int(record[3] - now), offline_since=stamp,
+             threshold=4, passed=False, reaction="⚽", success="ping", failed="failed")
+        for record in records
+    ]
+    result = {'events': events}
+    for name, running_msgs in (('legacy', legacy), ('records', records)):
+        bench = Bench(store_dir, 'pickle', world)
+        dictionary = {'running_msgs': running_msgs}
+        if name == 'records':
+            dictionary['version'] = SCHEMA_VERSION
+        store = PickleStore(bench.bot.file)
+        store.save(dictionary)
+        # just reading the file into records, without building any events
+        legacy_stamp.cache_clear()
+        start = time.perf_counter()
+        store.load()
+        result[name + '_read_s'] = round(time.perf_counter() - start, 4)
+        legacy_stamp.cache_clear()
+        start = time.perf_counter()
+        bench.bot.try_loading()
+        result[name + '_load_s'] = round(time.perf_counter() - start, 4)
+        result[name + '_bytes'] = os.path.getsize(bench.bot.file)
+        result[name + '_loaded'] = len(bench.bot.running_msgs)
+        bench.close()
+    return result
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def run(args) -> dict:
+    results = {
+        'meta': {
+            'revision': git_revision(),
+            'time': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'discord.py': discord.__version__,
+            'platform': platform.platform()
+        }
+    }
+    sizes = [int(size) for size in args.sizes.split(',')]
+    with tempfile.TemporaryDirectory() as store_dir:
+        def each(name, make):
+            if args.only and name not in args.only:
+                return
+            results[name] = []
+            for size in sizes:
+                print(name, size, file=sys.stderr)
+                results[name].append(asyncio.run(make(size)))
+
+        if not args.only or 'on_message' in args.only:
+            print('on_message', args.messages, file=sys.stderr)
+            results['on_message'] = asyncio.run(bench_on_message(store_dir, args.messages))
+        each('reactions', lambda size: bench_reactions(store_dir, size, args.samples))
+        each('resolutions', lambda size: bench_resolutions(store_dir, size))
+        each('save_load_pickle', lambda size: bench_save_load(store_dir, size, 'pickle'))
+        each('save_load_sqlite', lambda size: bench_save_load(store_dir, size, 'sqlite'))
+        if not args.only or 'load_schema' in args.only:
+            print('load_schema', args.schema_events, file=sys.stderr)
+            results['load_schema'] = asyncio.run(bench_load_schema(store_dir, args.schema_events))
+        each('memory', lambda size: bench_memory(store_dir, size))
+        each('idle', lambda size: bench_idle(store_dir, size, args.idle_seconds))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PlayBot benchmarks against a fake discord")
+    parser.add_argument('--sizes', default="100,1000,10000", help="comma separated open event counts")
+    parser.add_argument('--messages', type=int, default=5000, help="messages for the on_message benchmark")
+    parser.add_argument('--samples', type=int, default=2000, help="reactions timed per size")
+    parser.add_argument('--idle-seconds', type=float, default=2.0, help="how long to measure idle cpu for")
+    parser.add_argument('--schema-events', type=int, default=100000, help="saved events for the load_schema benchmark")
+    parser.add_argument('--only', nargs='*', help="on_message, reactions, resolutions, save_load_pickle, save_load_sqlite, load_schema, memory, idle")
+    parser.add_argument('--out', help="file to write the JSON to, defaults to stdout")
+    args = parser.parse_args()
+    results = run(args)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
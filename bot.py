@@ -1,16 +1,25 @@
 import os
-from os import path
 from datetime import datetime, timedelta
 import discord
-import pickle
-import copy
-import pytz
+import asyncio
 import time
-import re
+from collections import deque
+from functools import partial
 from threading import Thread
-from message_manager import ReactiveMessage, reactive_message_builder, BOT_TIME_ZONE
+from message_manager import ReactiveMessage, EventTemplate, ChannelGone, reactive_message_builder, BOT_TIME_ZONE
+from partition import Partition, PartitionedEvents
+from tracking import EventSelector
+from storage import PickleStore, SQLiteStore, SCHEMA_VERSION, shard_file, layout_files
+from guild_config import GuildConfig, guild_config_builder, DEFAULT_TIMEZONES
+from render import Renderer, get_timezone, zone_list
+from outbound import OutboundQueue, PRIORITY_REPLY, PRIORITY_HELP
+from pings import PingBatcher
+from command_parser import CommandRegistry, CommandError, Arg, has_prefix, tokenize, duration
+from metrics import Metrics, serve
+from ratelimit import KeyedLimiter
+from recurring import RecurringRule, Recurrence, recurrence, new_rule, recurring_rule_builder
+from loop_watchdog import LoopWatchdog
 from dotenv import load_dotenv
-from pprint import pprint
 
 
 class PlayBot(discord.Client):
@@ -18,13 +27,27 @@ class PlayBot(discord.Client):
     bot_id = 1234567890
     my_id = 1234567890
 
-    str_pattern = "\'.*?\'|\".*?\"|\(.*?\)|[a-zA-Z\d\_\*\-\\\+\/\[\]\?\!\@\#\$\%\&\=\~\`]+"
-    
     # day * hours * minutes * seconds
     max_event_time = 14 * 24 * 60 * 60 # 604800s
+    max_open_events = 100 # most events a guild can have running at once
+    max_recurring = 10 # most recurring events a guild can have
+    recurring_lead = 24 * 60 * 60 # how long before it starts each recurring event gets posted
+
+    # (commands, seconds) token buckets, checked before a command is even parsed
+    user_limit = (5, 30)
+    channel_limit = (15, 60)
+    guild_limit = (60, 60)
+    # seconds a success ping waits for others in the same channel to go out as one message, 0 for off
+    ping_batch_window = 0
 
     file = "./bot_stuff.p"
+    sharded = False # each shard saves to its own file when True
+    rehydrate_concurrency = 5 # how many saved messages get fetched at once on startup
+    rehydrate_window = 60 * 60 # saved messages due later than this are only fetched once they get this close
+    rehydrate_retry = 60 # seconds before fetching a saved message again after discord errored
+    db_file = "./bot_stuff.db"
     save_timer = 15 # how frequently the save file will be written
+    # the settings below are the defaults, each guild gets its own copy in `configs`
     permitted_roles = []
     role_format = "<@&{0}>"
     threshold = 3
@@ -34,23 +57,56 @@ class PlayBot(discord.Client):
     formated_success_str = "Yo, <@&{0}>! Let's get some games going!"
     formated_failed_str = "Sorry! Looks like we didn't get enough players for this time."
     reaction_str = "⚽"
-    running_msgs = []
-    roles = []
+    timezones = DEFAULT_TIMEZONES
     
     print_statements = False
 
     __bot_thread = None
+    __loaded = False
+    __metrics_server = None
 
-    def __init__(self, print_statements=False):
-        super().__init__()
+    def __init__(self, print_statements=False, intents: discord.Intents = None, **options):
+        if intents is None:
+            # commands are read out of message content, which discord.py 2 doesn't ask for by default
+            intents = discord.Intents.default()
+            intents.message_content = True
+        super().__init__(intents=intents, **options)
         load_dotenv()
-        self.pattern = re.compile(self.str_pattern)
         self.bot_id = os.getenv('BOT_ID')
         self.my_id = os.getenv('MY_ID')
         self.print_statements = print_statements
+        # set METRICS_PORT to serve Prometheus metrics on localhost
+        self.metrics_port = os.getenv('METRICS_PORT')
+        self.save_backend = os.getenv('SAVE_BACKEND', 'pickle')
+        # shard id -> Partition, made the first time something on that shard needs one
+        self.partitions = {}
+        self.running_msgs = PartitionedEvents(self.partitions)
+        # save files from a different shard layout, retired once everything in them is saved again
+        self.__stale_files = []
+        # guild id -> GuildConfig
+        self.configs = {}
+        self.rehydrate_time = None
+        # msg id -> task fetching a saved message, so a reaction and its deadline share one fetch
+        self.__materializing = {}
+        self.__register_commands()
+        self.renderer = Renderer(self.formated_prompt_str, self.commands)
+        self.metrics = Metrics()
+        self.__register_metrics()
+        self.outbound = OutboundQueue(metrics=self.metrics)
+        self.pings = PingBatcher(self.outbound, self.ping_batch_window, self.metrics)
+        self.watchdog = LoopWatchdog(self.metrics, on_stall=self.__loop_stalled)
+        self.limits = (
+            ('user', KeyedLimiter(*self.user_limit)),
+            ('channel', KeyedLimiter(*self.channel_limit)),
+            ('guild', KeyedLimiter(*self.guild_limit))
+        )
+        self.__save_task = None
+        # guild id -> {role id -> role}
+        self.roles = {}
+        # coroutine functions awaited once the event loop is running, EG: BotTerminal.serve
+        self.startup_hooks = []
 
     def initialize(self):
-        Thread(target=self.__save_loop).start()
         self.run(os.getenv('DISCORD_TOKEN'))
 
     def join_bot_thread(self):
@@ -75,8 +131,29 @@ class PlayBot(discord.Client):
         """
         return self.print_statements
 
+    async def setup_hook(self):
+        for hook in self.startup_hooks:
+            await hook()
+
     async def on_ready(self):
-        self.try_loading()
+        self.watchdog.start()
+        for partition in self.all_partitions():
+            partition.scheduler.start()
+        if not self.__loaded:
+            # on_ready also fires on reconnects, by then the running messages are already live
+            self.__loaded = True
+            self.try_loading()
+        if not self.__save_task or self.__save_task.done():
+            self.__save_task = asyncio.get_event_loop().create_task(self.__save_loop())
+        if self.metrics_port and not self.__metrics_server:
+            try:
+                self.__metrics_server = await serve(self.metrics, '127.0.0.1', int(self.metrics_port))
+            except Exception as e:
+                if self.print_statements:
+                    print("failed to start metrics server :/")
+                    print(e)
+        # rebuilt from scratch so reconnects don't pile up stale roles
+        self.roles = {}
         for guild in self.guilds:
             if self.print_statements:
                 print(
@@ -85,7 +162,7 @@ class PlayBot(discord.Client):
                     f'\nChannel list: {guild.text_channels}'
                     f'\nRoles in order: {guild.roles}'
                 )
-            self.roles.extend(guild.roles)
+            self.index_guild_roles(guild)
         # Setting `Playing ` status
         # await Playbot.change_presence(self, activity=discord.Game(name="a game"))
 
@@ -98,293 +175,1014 @@ class PlayBot(discord.Client):
         # await Playbot.change_presence(self, activity=discord.Activity(type=discord.ActivityType.watching, name="a movie"))
 
 
+    def __register_commands(self):
+        """
+        Helper that fills in the table of discord commands
+        """
+        self.commands = CommandRegistry()
+        self.commands.register(
+            'ping', self.set_ping_command, [Arg('role id', int)], restricted=True,
+            help="sets which role will be pinged")
+        self.commands.register(
+            'count', self.set_threshold_command, [Arg('integer', int)], restricted=True,
+            help="sets how many players will be needed to make a ping")
+        # permit has its own check, anyone can permit the first role
+        self.commands.register(
+            'permit', self.set_permit_command, [Arg('role id', int)],
+            help="sets which roles can control my settings")
+        self.commands.register(
+            'remove', self.remove_permit_command, [Arg('role id', int)], restricted=True,
+            help="removes which roles can control my settings")
+        self.commands.register(
+            'reaction', self.set_reaction_command, [Arg('emoji', str, rest=True)], restricted=True,
+            help="sets which emoji will used")
+        self.commands.register(
+            'zones', self.set_zones_command, [Arg('zone names', zone_list, rest=True)], restricted=True,
+            help="sets which timezones the event time is shown in, EG: `America/New_York Europe/London`")
+        self.commands.register(
+            'every', self.every_command, [Arg('days [at h:m]', recurrence, rest=True)], restricted=True,
+            help="posts an event over and over, EG: `every weekday at 19:00`, `every 2 days` or `every mon,fri at 20:30`. "
+            "Times are in the first timezone from `zones`")
+        self.commands.register(
+            'schedules', self.schedules_command,
+            help="lists the recurring events and their ids")
+        self.commands.register(
+            'unschedule', self.unschedule_command, [Arg('id', int)], restricted=True,
+            help="stops a recurring event, see `schedules` for the ids")
+        self.commands.register(
+            'help', self.help_command,
+            help="get the list of commands")
+        # This is the main command -> 'd:h:m'
+        self.commands.set_default(
+            self.create_reactive_message_command, [Arg('d:h:m', duration)],
+            help="schedules an event 'd:h:m' time from now and if enough players wanna join in, it'll ping! Formats are: `d:h:m`, `h:m`, and `m`")
+
+    def __register_metrics(self):
+        """
+        Helper that sets up everything the bot records in `metrics`
+        """
+        self.__command_time = self.metrics.histogram(
+            'playbot_command_seconds', "Time taken handling a command", ('command',))
+        self.__command_count = self.metrics.counter(
+            'playbot_commands_total', "Commands seen, by how they turned out", ('command', 'result'))
+        self.__limited_count = self.metrics.counter(
+            'playbot_commands_limited_total', "Commands dropped for going over a rate limit, by which one", ('scope',))
+        self.__reaction_count = self.metrics.counter(
+            'playbot_reaction_events_total', "Raw reaction events processed", ('kind', 'tracked'))
+        self.__save_time = self.metrics.histogram('playbot_save_seconds', "Time taken writing a shard's save file", ('shard',))
+        self.__save_bytes = self.metrics.gauge('playbot_save_bytes', "Size of every save file after the last save",
+            lambda: sum(partition.store.size() for partition in list(self.partitions.values())))
+        self.__load_time = self.metrics.histogram('playbot_load_seconds', "Time taken loading the save files")
+        self.__load_bytes = self.metrics.gauge('playbot_load_bytes', "Size of the save files when they were loaded")
+        self.metrics.gauge('playbot_open_events', "Events waiting on reactions", lambda: len(self.running_msgs))
+        self.metrics.gauge('playbot_scheduled_timers', "Timers waiting in the schedulers", self.scheduled_timers)
+        self.metrics.gauge('playbot_recurring_rules', "Recurring events",
+            lambda: sum(len(partition.rules) for partition in list(self.partitions.values())))
+        self.metrics.gauge('playbot_partitions', "Shards with their own state", lambda: len(self.partitions))
+        self.metrics.gauge('playbot_outbound_queued', "Discord calls waiting in the outbound queue", lambda: len(self.outbound))
+
+    def __loop_stalled(self, stall):
+        if self.print_statements:
+            print(stall)
+
     async def on_message(self, message: discord.message.Message):
-        cont = str(message.content)
-        # Here begins a giant ugly list of command checking
-        if message.author.id == self.bot_id or self.base_command not in cont:
+        guild_id = self.__guild_id(message)
+        config = self.get_config(guild_id)
+        if not has_prefix(message.content, config.base_command) or message.author == self.user:
             return
+        if not self.__within_limits(message.author.id, message.channel.id, guild_id):
+            return
+        command, tokens = self.commands.lookup(tokenize(message.content[len(config.base_command):]))
+        start = time.perf_counter()
+        result = await self.__run_command(message, config, command, tokens)
+        name = command.name or 'create'
+        self.__command_count.inc(name, result)
+        self.__command_time.observe(time.perf_counter() - start, name)
+
+    def __within_limits(self, user_id: int, channel_id: int, guild_id: int) -> bool:
+        """
+        Helper that takes a token from the user's, channel's and guild's buckets
+
+        Nothing is taken unless all of them have one, so a user going over
+        their own limit doesn't eat into everyone else's in the channel
+
+        Returns:
+            bool: False if the command should be dropped
+        """
+        buckets = []
+        for (scope, limiter), key in zip(self.limits, (user_id, channel_id, guild_id)):
+            if key is None:
+                continue
+            bucket = limiter.bucket(key)
+            if bucket.remaining() < 1:
+                self.__limited_count.inc(scope)
+                return False
+            buckets.append(bucket)
+        for bucket in buckets:
+            bucket.try_take()
+        return True
+
+    async def __run_command(self, message: discord.Message, config: GuildConfig, command, tokens: list) -> str:
+        """
+        Helper that checks permissions, converts arguments and runs a command
+
+        Returns:
+            str: how it went, 'ok', 'denied', 'bad_args' or 'error'
+        """
+        try:
+            if command.restricted and not config.is_permitted(message.author):
+                await self.permission_failure(message, config)
+                return 'denied'
+            args = command.convert(tokens)
+        except CommandError as e:
+            if command is self.commands.default and not tokens:
+                await self.outbound.send(message.channel, content="<@" + str(message.author.id) + ">, there should be 2 arguments. EG: `!play 1:00` to play in 1hr")
+            elif command is self.commands.default:
+                await self.outbound.send(
+                    message.channel,
+                    content="Sorry I couldn't understand that :(\n" +
+                    "The defualt format is `" + config.base_command + " h:m`. You can use these formats: `d:h:m`, `h:m`, and `m`")
+            else:
+                await self.outbound.send(message.channel, content="Sorry, I couldn't undersand that. Usage: `" + config.base_command + " " + command.usage() + "`")
+            return 'bad_args'
         try:
-            argv = self.tokenize(message.content)
-            if argv[0] == self.base_command:
-                if argv[1] == 'help':
-                    await self.help_command(message)
-                elif argv[1] == 'ping':
-                    await self.set_ping_command(message)
-                elif argv[1] == 'permit':
-                    await self.set_permit_command(message)
-                elif argv[1] == 'remove':
-                    await self.remove_permit_command(message)
-                elif argv[1] == 'count':
-                    await self.set_threshold_command(message)
-                elif argv[1] == 'reaction':
-                    await self.set_reaction_command(message)
-                elif cont.startswith(self.base_command):
-                    # This is the main command -> 'd:h:m'
-                    await self.create_reactive_message_command(message)
+            await command.handler(message, config, *args)
         except Exception as e:
-            pass
-        self.try_saving()
+            return 'error'
+        return 'ok'
 
-    async def create_reactive_message_command(self, message: discord.Message):
-        cont = str(message.content)
-        if len(cont.split(' ')) > 1:
-            try:
-                time_str = cont.split(' ')[1]
-                time_split = time_str.split(':')
-                days = 0
-                hrs = 0
-                minutes = int(time_split[0])                    
-                if len(time_split) == 2:
-                    hrs = int(time_split[0])
-                    minutes = int(time_split[1])
-                elif len(time_split) > 2:
-                    days = int(time_split[0])
-                    hrs = int(time_split[1])
-                    minutes = int(time_split[2])
-                now = datetime.now(tz=pytz.timezone(BOT_TIME_ZONE))
-                delta = timedelta(days=days, hours=hrs, minutes=minutes)
-                now = now + delta
-                delay_seconds = int(delta.total_seconds())
-                if delay_seconds > self.max_event_time:
-                    await message.channel.send("Sorry that's too far into the future!\n")
-                    return
-                embed_var = discord.Embed(
-                    title="Let's Play!", 
-                    description=self.formated_prompt_str.format(
-                        delta.days, 
-                        int(delta.seconds / (60 * 60)),
-                        int(delta.seconds / 60) % 60,
-                        self.threshold, 
-                        self.reaction_str))
-                embed_var.add_field(name='Pacific Time', value=now.strftime("%A\n%d/%m/%Y\n%I:%M %p"))
-                now = now.astimezone(tz=pytz.timezone('US/Eastern'))
-                embed_var.add_field(name='Eastern Time', value=now.strftime("%A\n%d/%m/%Y\n%I:%M %p"))
-                now = now.astimezone(tz=pytz.timezone('Europe/Madrid'))
-                embed_var.add_field(name='Central European Time', value=now.strftime("%A\n%d/%m/%Y\n%I:%M %p"))
-
-                self.running_msgs.append(
-                    ReactiveMessage(
-                        message.channel, 
-                        embed_var, 
-                        self.reaction_str, 
-                        self.formated_success_str.format(self.pinging), 
-                        self.formated_failed_str, 
-                        delay_seconds, 
-                        self.threshold
-                    )
-                )
-            except Exception as e:
-                await message.channel.send(
-                    "Sorry I couldn't understand that :(\n" +
-                    "The defualt format is `" + self.base_command + "h:m`. You can use these formats: `d:h:m`, `h:m`, and `m`")
-        else:
-            await message.channel.send("<@" + str(message.author.id) + ">, there should be 2 arguments. EG: `!play 1:00` to play in 1hr")
+    async def create_reactive_message_command(self, message: discord.Message, config: GuildConfig, delta: timedelta):
+        if config.guild_id is None:
+            await self.outbound.send(message.channel, content="Sorry, events only work in servers")
+            return
+        delay_seconds = int(delta.total_seconds())
+        if delay_seconds > self.max_event_time:
+            await self.outbound.send(message.channel, content="Sorry that's too far into the future!\n")
+            return
+        if self.__at_capacity(config):
+            await self.outbound.send(message.channel, content="Sorry, there are too many events going on already! Try again once some are done")
+            return
+        self.__open_event(message.channel, config, delta)
 
-    async def set_reaction_command(self, message: discord.Message):
-        cont = str(message.content)
-        if message.author.top_role.id in self.permitted_roles:
-            try:
-                temp = cont.replace(self.base_command + ' reaction ', '')
-                await message.add_reaction(temp)
-                self.reaction_str = temp
-            except Exception as e:
-                await message.channel.send("I can't use that emoji :(")
-        else:
-            await self.permission_failure(message)
+    def __at_capacity(self, config: GuildConfig) -> bool:
+        """
+        Helper that checks if a guild already has `max_open_events` running,
+        DMs have no guild to count against so they're always at capacity
+        """
+        if config.guild_id is None:
+            return True
+        return self.partition(config.guild_id).running_msgs.open_in_guild(config.guild_id) >= self.max_open_events
 
-    async def set_threshold_command(self, message: discord.Message):
-        cont = str(message.content)
-        if message.author.top_role.id in self.permitted_roles:
-            try:
-                self.threshold = int(cont.replace(self.base_command + ' count ', ''))
-                await message.channel.send("I will ping when I see " + str(self.threshold) + " or more players moving forward :)")
-            except Exception as e:
-                await message.channel.send("Sorry I couldn't understand that :(")
-        else:
-            await self.permission_failure(message)
+    def __open_event(self, channel: discord.TextChannel, config: GuildConfig, delta: timedelta) -> ReactiveMessage:
+        """
+        Helper that posts an event `delta` from now
+        """
+        when = datetime.now(tz=get_timezone(BOT_TIME_ZONE)) + delta
+        embed_var = self.renderer.prompt_embed(config, delta, when)
 
-    async def remove_permit_command(self, message: discord.Message):
-        cont = str(message.content)
-        if message.author.top_role.id in self.permitted_roles:
-            try:
-                role_id = int(cont.replace(self.base_command + ' remove ', ''))
-                self.permitted_roles.pop(self.permitted_roles.index(role_id))
-                await message.channel.send("I will no longer listen to the " + self.get_role(role_id).name +" role")
-            except Exception as e:
-                await message.channel.send("Sorry, I couldn't undersand that")
+        return ReactiveMessage(
+            channel,
+            embed_var,
+            config.reaction_str,
+            int(delta.total_seconds()),
+            config.threshold,
+            self.event_template(
+                self.formated_success_str.format(config.pinging),
+                self.formated_failed_str,
+                self.partition(config.guild_id))
+        )
+
+    async def every_command(self, message: discord.Message, config: GuildConfig, spec: Recurrence):
+        if config.guild_id is None:
+            await self.outbound.send(message.channel, content="Sorry, recurring events only work in servers")
+            return
+        partition = self.partition(config.guild_id)
+        if sum(1 for rule in partition.rules.values() if rule.guild_id == config.guild_id) >= self.max_recurring:
+            await self.outbound.send(message.channel, content="Sorry, there are too many recurring events already! Use `" + config.base_command + " unschedule` on one first")
+            return
+        zone = config.timezones[0][1] if config.timezones else BOT_TIME_ZONE
+        rule = new_rule(message.id, config.guild_id, message.channel.id, spec, zone)
+        partition.rules[rule.rule_id] = rule
+        partition.dirty_rules.add(rule.rule_id)
+        self.__arm_rule(rule)
+        await self.outbound.send(
+            message.channel,
+            content="Got it! I'll post an event " + rule.describe() + ", the first one is <t:" + str(int(rule.next_at)) + ":F>")
+
+    async def schedules_command(self, message: discord.Message, config: GuildConfig):
+        rules = [rule for rule in self.partition(config.guild_id).rules.values() if rule.guild_id == config.guild_id]
+        if not rules:
+            await self.outbound.send(message.channel, content="There aren't any recurring events")
+            return
+        await self.outbound.send(message.channel, content="\n".join(
+            "`" + str(rule.rule_id) + "` " + rule.describe() + " in <#" + str(rule.channel_id) + ">, next <t:" + str(int(rule.next_at)) + ":R>"
+            for rule in sorted(rules, key=lambda rule: rule.next_at)))
+
+    async def unschedule_command(self, message: discord.Message, config: GuildConfig, rule_id: int):
+        rule = self.partition(config.guild_id).rules.get(rule_id)
+        if rule is None or rule.guild_id != config.guild_id:
+            await self.outbound.send(message.channel, content="Sorry, I couldn't find that recurring event")
+            return
+        self.drop_rule(rule_id)
+        await self.outbound.send(message.channel, content="I won't post " + rule.describe() + " anymore")
+
+    async def set_reaction_command(self, message: discord.Message, config: GuildConfig, emoji: str):
+        try:
+            await self.outbound.add_reaction(message, emoji, PRIORITY_REPLY)
+            config.reaction_str = emoji
+            self.mark_dirty(guild_id=config.guild_id)
+        except Exception as e:
+            await self.outbound.send(message.channel, content="I can't use that emoji :(")
+
+    async def set_threshold_command(self, message: discord.Message, config: GuildConfig, count: int):
+        config.threshold = count
+        self.mark_dirty(guild_id=config.guild_id)
+        await self.outbound.send(message.channel, content="I will ping when I see " + str(config.threshold) + " or more players moving forward :)")
+
+    async def remove_permit_command(self, message: discord.Message, config: GuildConfig, role_id: int):
+        if role_id not in config.permitted_roles:
+            await self.outbound.send(message.channel, content="Sorry, I couldn't undersand that")
+            return
+        config.permitted_roles.remove(role_id)
+        self.mark_dirty(guild_id=config.guild_id)
+        await self.outbound.send(message.channel, content="I will no longer listen to the " + self.__role_name(role_id, config) +" role")
+
+    async def set_permit_command(self, message: discord.Message, config: GuildConfig, role_id: int):
+        if (not config.permitted_roles) or config.is_permitted(message.author) or message.author.id == int(self.my_id):
+            config.permitted_roles.add(role_id)
+            self.mark_dirty(guild_id=config.guild_id)
+            await self.outbound.send(message.channel, content="I will listen to the " + self.__role_name(role_id, config) +" role when they command me to :)")
         else:
-            await self.permission_failure(message)
+            await self.permission_failure(message, config)
 
-    async def set_permit_command(self, message: discord.Message):
-        cont = str(message.content)
-        if (not self.permitted_roles) or message.author.top_role.id in self.permitted_roles or message.author.id == int(self.my_id):
-            try:
-                role_id = int(cont.replace(self.base_command + ' permit ', ''))
-                self.permitted_roles.append(role_id)
-                await message.channel.send("I will listen to the " + self.get_role(role_id).name +" role when they command me to :)")
-            except Exception as e:
-                await message.channel.send("Sorry, I couldn't undersand that")
+    async def help_command(self, message: discord.Message, config: GuildConfig):
+        await self.outbound.send(message.channel, PRIORITY_HELP, embed=self.renderer.help_embed(config))
+
+    async def set_zones_command(self, message: discord.Message, config: GuildConfig, zones: list):
+        config.timezones = zones
+        self.mark_dirty(guild_id=config.guild_id)
+        await self.outbound.send(message.channel, content="I will show event times in " + ", ".join(label for label, _ in zones) + " :)")
+
+    async def set_ping_command(self, message: discord.Message, config: GuildConfig, role_id: int):
+        config.pinging = role_id
+        self.mark_dirty(guild_id=config.guild_id)
+        await self.outbound.send(message.channel, content="I will ping " + self.__role_name(role_id, config, "them") +" when the time comes :)")
+
+    def __role_name(self, role_id: int, config: GuildConfig, fallback: str = "unknown") -> str:
+        """
+        Helper that gets a role's name for replies
+        """
+        role = self.get_role(role_id, config.guild_id)
+        if role:
+            return role.name
+        return fallback
+
+    async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
+        # Raw events fire even for messages that aren't in the cache (EG: after a restart)
+        rmsg = self.partition(payload.guild_id).running_msgs.get(payload.message_id)
+        if rmsg is None or str(payload.emoji) != rmsg.get_reaction():
+            self.__reaction_count.inc('add', 'untracked')
+            return
+        self.__reaction_count.inc('add', 'tracked')
+        if not rmsg.reconciled:
+            # still parked from a restart, the fetch counts this reaction too
+            await self.materialize(rmsg)
+            return
+        rmsg.reaction_added()
+        if payload.user_id != self.user.id:
+            await rmsg.check_threshold()
+
+    async def on_raw_reaction_remove(self, payload: discord.RawReactionActionEvent):
+        rmsg = self.partition(payload.guild_id).running_msgs.get(payload.message_id)
+        if rmsg is None or str(payload.emoji) != rmsg.get_reaction():
+            self.__reaction_count.inc('remove', 'untracked')
+            return
+        self.__reaction_count.inc('remove', 'tracked')
+        rmsg.reaction_removed()
+
+    async def on_raw_reaction_clear(self, payload: discord.RawReactionClearEvent):
+        await self.__reactions_cleared(payload, None)
+
+    async def on_raw_reaction_clear_emoji(self, payload: discord.RawReactionClearEmojiEvent):
+        await self.__reactions_cleared(payload, str(payload.emoji))
+
+    async def __reactions_cleared(self, payload, emoji: str):
+        """
+        Helper that resets the tally when a moderator clears the reactions, otherwise
+        the old count would still pass the event
+
+        Args:
+            payload: the raw clear event
+            emoji (str): the emoji that got cleared, None for every emoji
+        """
+        rmsg = self.partition(payload.guild_id).running_msgs.get(payload.message_id)
+        if rmsg is None or emoji not in (None, rmsg.get_reaction()):
+            self.__reaction_count.inc('clear', 'untracked')
+            return
+        self.__reaction_count.inc('clear', 'tracked')
+        rmsg.reactions_cleared()
+        try:
+            # the bot's own reaction went too, putting it back counts it again like when it was posted
+            await self.outbound.add_reaction(rmsg.get_msg(), rmsg.get_reaction())
+        except Exception as e:
+            if self.print_statements:
+                print("couldn't react again to", payload.message_id)
+                print(e)
+
+    async def permission_failure(self, message: discord.Message, config: GuildConfig):
+        """
+        Helper function, just decides how to send a failure message
+        """
+        if config.permitted_roles:
+            await self.outbound.send(message.channel, content="Sorry, you do not have permission <@" + str(message.author.id) + ">")
         else:
-            await self.permission_failure(message)
-
-    async def help_command(self, message: discord.Message):
-        desc = (
-            self.base_command +
-            " ping [role id]\n"+
-            "\tsets which role will be pinged\n\n"+
-            self.base_command +
-            " count [integer]\n"+
-            "\tsets how many players will be needed to make a ping\n\n"+
-            self.base_command +
-            " permit [role id]\n"+
-            "\tsets which roles can control my settings\n\n"+
-            self.base_command +
-            " remove [role id]\n"+
-            "\tremoves which roles can control my settings\n\n"+
-            self.base_command +
-            " reaction [emoji]\n"+
-            "\tsets which emoji will used\n\n"+
-            self.base_command +
-            " [d:h:m]\n"+
-            "\tschedules an event 'd:h:m' time from now and if enough players wanna join in, it'll ping! Formats are: `d:h:m`, `h:m`, and `m`\n\n"+
-            self.base_command +
-            " help\n"+
-            "\tget the list of commands"
-        )
-        embed_var = discord.Embed(title="Commands", description=desc)
-        await message.channel.send(embed=embed_var)
+            await self.outbound.send(message.channel, content="Permissions must be set first! <@" + str(message.author.id) + ">")
 
-    async def set_ping_command(self, message: discord.Message):
-        cont = str(message.content)
-        if message.author.top_role.id in self.permitted_roles:
-            try:
-                self.pinging = int(cont.replace(self.base_command + ' ping ', ''))
-                name = "them"
-                role = self.get_role(self.pinging)
-                if role:
-                    name = role.name
-                await message.channel.send("I will ping " + name +" when the time comes :)")
-            except Exception as e:
-                await message.channel.send("Sorry, I couldn't undersand that")
+    def get_config(self, guild_id: int) -> GuildConfig:
+        """
+        Gets the settings of a guild, guilds without any get a copy of the defaults
+
+        Args:
+            guild_id (int): guild id, None for DMs
+
+        Returns:
+            GuildConfig: the guild's settings
+        """
+        config = self.configs.get(guild_id)
+        if config is None:
+            config = GuildConfig(
+                guild_id,
+                self.threshold,
+                self.pinging,
+                self.reaction_str,
+                self.base_command,
+                self.permitted_roles,
+                self.timezones
+            )
+            if guild_id is not None:
+                # DMs get a throwaway copy so they can't change anything
+                self.configs[guild_id] = config
+        return config
+
+    def set_config(self, key: str, value, guild_id: int = None):
+        """
+        Changes a setting, must be called from the event loop
+
+        Args:
+            key (str): 'threshold', 'pinging', 'reaction_str', 'base_command' or 'timezones'
+            value: new value
+            guild_id (int): guild to change, None changes the defaults and every guild
+        """
+        if guild_id is None:
+            setattr(self, key, value)
+            self.mark_dirty()
+            configs = list(self.configs.values())
         else:
-            await self.permission_failure(message)
+            configs = [self.get_config(guild_id)]
+        for config in configs:
+            setattr(config, key, value)
+            self.mark_dirty(guild_id=config.guild_id)
 
-    async def on_reaction_add(self, reaction: discord.reaction.Reaction, user: discord.user.User):
-        # Checking reactions
-        message = reaction.message
-        for rmsg in self.running_msgs:
-            if rmsg.is_complete():
-                self.running_msgs.pop(self.running_msgs.index(rmsg))
-            elif (
-                    message.id == rmsg.get_msg().id 
-                    and user.id != self.bot_id
-                    and rmsg.get_threshold() <= reaction.count
-                ):
-                await rmsg.send_success_msg()
-                rmsg.passed_threshold()
-                self.running_msgs.pop(self.running_msgs.index(rmsg))
-
-    async def permission_failure(self, message: discord.Message):
+    def permit_role(self, role_id: int, allowed: bool, guild_id: int = None):
         """
-        Helper function, just decides how to send a failure message
+        Adds or removes a permitted role, must be called from the event loop
+
+        Args:
+            role_id (int): role to change
+            allowed (bool): True to permit, False to remove
+            guild_id (int): guild to change, None changes the defaults and every guild
         """
-        if self.permitted_roles:
-            await message.channel.send("Sorry, you do not have permission <@" + str(message.author.id) + ">")
+        if guild_id is None:
+            if allowed and role_id not in self.permitted_roles:
+                self.permitted_roles = self.permitted_roles + [role_id]
+            elif not allowed and role_id in self.permitted_roles:
+                self.permitted_roles = [role for role in self.permitted_roles if role != role_id]
+            self.mark_dirty()
+            configs = list(self.configs.values())
         else:
-            await message.channel.send("Permissions must be set first! <@" + str(message.author.id) + ">")
+            configs = [self.get_config(guild_id)]
+        for config in configs:
+            if allowed:
+                config.permitted_roles.add(role_id)
+            else:
+                config.permitted_roles.discard(role_id)
+            self.mark_dirty(guild_id=config.guild_id)
 
-    def tokenize(self, line: str):
+    def __guild_id(self, message: discord.Message) -> int:
+        """
+        Helper that gets the guild id of a message, None for DMs
         """
-        Helper that tokenizes line into an argument vector
+        return message.guild.id if message.guild else None
+
+    def partition_count(self) -> int:
+        """
+        Returns:
+            int: how many partitions guilds get split between, one per shard
+        """
+        return 1
+
+    def shard_of(self, guild_id: int) -> int:
+        """
+        Same sharding discord uses, so a partition lines up with a gateway shard
 
         Args:
-            line (str): a command straight off the command line
+            guild_id (int): guild id, None for DMs which all go to shard 0
+        """
+        if guild_id is None:
+            return 0
+        return (guild_id >> 22) % self.partition_count()
 
+    def partition(self, guild_id: int) -> Partition:
+        """
+        Gets the state partition a guild belongs to
+
+        Args:
+            guild_id (int): guild id, None for DMs
+        """
+        shard_id = self.shard_of(guild_id)
+        partition = self.partitions.get(shard_id)
+        if partition is None:
+            partition = self.__partition(shard_id)
+        return partition
+
+    def all_partitions(self) -> list:
+        """
+        Returns:
+            list: a Partition for every shard, making any that don't exist yet
+        """
+        return [self.__partition(shard_id) for shard_id in range(self.partition_count())]
+
+    def __partition(self, shard_id: int) -> Partition:
+        partition = self.partitions.get(shard_id)
+        if partition is None:
+            count = self.partition_count() if self.sharded else None
+            store = self.__open_store(shard_file(self.save_file(), shard_id, count))
+            partition = self.partitions[shard_id] = Partition(shard_id, store)
+            try:
+                asyncio.get_running_loop()
+                partition.scheduler.start()
+            except RuntimeError:
+                # not on the loop yet, on_ready starts it
+                pass
+        return partition
+
+    def save_file(self) -> str:
+        """
         Returns:
-            argv [list]: Contains each seperate word
-        """
-        if not self.pattern:
-            self.pattern = re.compile(self.str_pattern)
-        argv = []
-        none_matched = True
-        for match in re.finditer(self.pattern, line):
-            if none_matched:
-                none_matched = False
-            argv.append(match.group(0).rstrip())
-        if none_matched:
-            argv.append(line)
-        return argv
+            str: the unsharded save file for the backend in use
+        """
+        return self.db_file if self.save_backend == 'sqlite' else self.file
+
+    def __open_store(self, file: str):
+        if self.save_backend == 'sqlite':
+            return SQLiteStore(file)
+        return PickleStore(file)
+
+    def scheduled_timers(self) -> int:
+        """
+        Returns:
+            int: timers waiting across every partition's scheduler
+        """
+        return sum(len(partition.scheduler) for partition in list(self.partitions.values()))
 
     def try_loading(self):
         """
         Helper that loads in save file so that some previous commands are loaded
+
+        Save files from a different shard layout (EG: the shard count changed)
+        are loaded too, their guilds and messages get moved to the partitions
+        they belong to now
         """
         try:
-            if path.exists(self.file):
-                dictionary = pickle.load(open(self.file, 'rb'))
-                self.permitted_roles = dictionary['permitted_roles']
-                self.threshold = dictionary['threshold']
-                self.base_command = dictionary['base_command']
-                self.reaction_str = dictionary['reaction_str']
-                self.pinging = dictionary['pinging']
-                self.running_msgs = [reactive_message_builder(rmsg_dict, self.guilds) for rmsg_dict in dictionary['running_msgs']]
-                self.save_time = dictionary['save_timer']
-                self.max_event_time = dictionary['max_event_time']
+            start = time.perf_counter()
+            partitions = self.all_partitions()
+            current = set(partition.store.file for partition in partitions)
+            stale = [file for file in layout_files(self.save_file()) if file not in current]
+            dictionaries = [partition.store.load() for partition in partitions]
+            size = sum(partition.store.size() for partition in partitions)
+            for file in stale:
+                store = self.__open_store(file)
+                dictionaries.append(store.load())
+                size += store.size()
+                store.close()
+            moved_from = len(partitions)
+            if any(dictionaries):
+                # every file carries the bot-wide settings, an incremental one might not have any yet
+                settings = next((dictionary for dictionary in dictionaries if dictionary and 'threshold' in dictionary), {})
+                self.permitted_roles = settings.get('permitted_roles', self.permitted_roles)
+                self.threshold = settings.get('threshold', self.threshold)
+                self.base_command = settings.get('base_command', self.base_command)
+                self.reaction_str = settings.get('reaction_str', self.reaction_str)
+                self.pinging = settings.get('pinging', self.pinging)
+                self.timezones = settings.get('timezones', self.timezones)
+                self.save_timer = settings.get('save_timer', self.save_timer)
+                self.max_event_time = settings.get('max_event_time', self.max_event_time)
+                self.max_open_events = settings.get('max_open_events', self.max_open_events)
+                self.rehydrate_concurrency = settings.get('rehydrate_concurrency', self.rehydrate_concurrency)
+                self.rehydrate_window = settings.get('rehydrate_window', self.rehydrate_window)
+                self.pings.window = settings.get('ping_batch_window', self.pings.window)
+                # older saves don't have any guilds and just fall back to the defaults above
+                self.configs = {}
+                for partition in partitions:
+                    partition.reset()
+                rmsgs = []
+                for i, dictionary in enumerate(dictionaries):
+                    if not dictionary:
+                        continue
+                    moved = i >= moved_from
+                    for config_dict in dictionary.get('guilds', []):
+                        config = guild_config_builder(config_dict)
+                        self.configs[config.guild_id] = config
+                        if moved:
+                            self.mark_dirty(guild_id=config.guild_id)
+                    for record in dictionary.get('running_msgs', []):
+                        msg_id, guild_id, _, _, _, _, _, success, failed = record
+                        rmsg = reactive_message_builder(
+                            record,
+                            self.event_template(success, failed, self.partition(guild_id)))
+                        rmsgs.append(rmsg)
+                        if moved:
+                            self.partition(guild_id).mark_msg_dirty(msg_id)
+                    for record in dictionary.get('recurring', []):
+                        rule = recurring_rule_builder(record)
+                        partition = self.partition(rule.guild_id)
+                        partition.rules[rule.rule_id] = rule
+                        self.__arm_rule(rule)
+                        if moved:
+                            partition.dirty_rules.add(rule.rule_id)
+                if stale:
+                    self.mark_dirty()
+                    self.__stale_files = stale
+                asyncio.get_event_loop().create_task(self.rehydrate(rmsgs))
+                self.__load_time.observe(time.perf_counter() - start)
+                self.__load_bytes.set(size)
                 if self.print_statements:
-                    print('File loaded')
-                    pprint(dictionary)
+                    print('Files loaded,', len(rmsgs), 'saved messages,', size, 'bytes')
+                    if stale:
+                        print('Moved everything from', stale, 'into', sorted(current))
         except Exception as e:
             if self.print_statements:
                 print("failed to load file :/")
                 print(e)
 
+    async def rehydrate(self, rmsgs: list):
+        """
+        Fetches saved messages and starts their timers, soonest deadline first
+
+        Only messages due within `rehydrate_window` get fetched now, at most
+        `rehydrate_concurrency` at once. The rest are parked in the scheduler
+        as ids until they get that close or someone reacts to them, so how long
+        this takes depends on what's coming up soon, not on everything saved
+
+        Args:
+            rmsgs (list): ReactiveMessages fresh out of `reactive_message_builder`
+        """
+        start = time.perf_counter()
+        horizon = time.time() + self.rehydrate_window
+        near = []
+        parked = 0
+        for rmsg in rmsgs:
+            if rmsg.is_complete():
+                continue
+            if rmsg.deadline <= horizon:
+                near.append(rmsg)
+            else:
+                rmsg.park(rmsg.deadline - self.rehydrate_window)
+                parked += 1
+        queue = deque(sorted(near, key=lambda rmsg: rmsg.deadline))
+        armed = 0
+
+        async def worker():
+            nonlocal armed
+            while queue:
+                if await self.materialize(queue.popleft()):
+                    armed += 1
+
+        workers = min(self.rehydrate_concurrency, len(queue))
+        await asyncio.gather(*[worker() for _ in range(workers)])
+        self.rehydrate_time = time.perf_counter() - start
+        if self.print_statements:
+            print(
+                "Armed", armed, "of", len(near), "saved messages in", round(self.rehydrate_time, 2), "seconds,",
+                parked, "parked until they're due")
+
+    async def materialize(self, rmsg: ReactiveMessage) -> bool:
+        """
+        Fetches a saved message and starts its timer, unless that's already happened
+
+        Args:
+            rmsg (ReactiveMessage): message out of `reactive_message_builder`, parked or not
+
+        Returns:
+            bool: True if the message is live, False if it had to be dropped
+        """
+        if rmsg.reconciled or rmsg.is_complete():
+            return not rmsg.is_complete()
+        task = self.__materializing.get(rmsg.msg_id)
+        if task is None:
+            task = asyncio.get_event_loop().create_task(self.__fetch_saved_msg(rmsg))
+            self.__materializing[rmsg.msg_id] = task
+            task.add_done_callback(lambda _: self.__materializing.pop(rmsg.msg_id, None))
+        return await task
+
+    async def __fetch_saved_msg(self, rmsg: ReactiveMessage) -> bool:
+        channel = self.get_channel(rmsg.get_channel_id())
+        try:
+            if channel is None:
+                guild = self.get_guild(rmsg.guild_id)
+                if guild is None or guild.unavailable:
+                    # EG: a discord outage at startup, the guild's channels just aren't cached
+                    raise ConnectionError("guild " + str(rmsg.guild_id) + " is unavailable")
+                raise ChannelGone("channel " + str(rmsg.get_channel_id()) + " is gone")
+            await rmsg.rehydrate(channel)
+            return True
+        except (ChannelGone, discord.NotFound, discord.Forbidden) as e:
+            # the message or channel was deleted while we were offline, or we can't see it anymore
+            self.drop_running_msg(rmsg.msg_id)
+            if self.print_statements:
+                print("failed to rehydrate msg", rmsg.msg_id)
+                print(e)
+            return False
+        except Exception as e:
+            # EG: a timeout or a discord outage, the message is most likely still there
+            if not rmsg.is_complete():
+                rmsg.park(time.time() + self.rehydrate_retry)
+            if self.print_statements:
+                print("failed to rehydrate msg", rmsg.msg_id, "trying again in", self.rehydrate_retry, "seconds")
+                print(e)
+            return False
+
+    def mark_dirty(self, guild_id: int = None):
+        """
+        Flags that something worth saving has changed since the last save
+
+        Running messages flag their own partition through its tracker
+
+        Args:
+            guild_id (int): id of the guild whose settings changed,
+                leaving it out flags the bot-wide settings in every partition
+        """
+        if guild_id is not None:
+            self.partition(guild_id).dirty_guilds.add(guild_id)
+        else:
+            for partition in self.all_partitions():
+                partition.dirty = True
+
+    def is_dirty(self) -> bool:
+        """
+        Returns:
+            bool: True if there are unsaved changes
+        """
+        return any(partition.is_dirty() for partition in list(self.partitions.values()))
+
     def try_saving(self):
         """
         Helper that saves a file so that some previous commands can be loaded
+
+        This blocks until the file is written, on the event loop use `save_now`
         """
-        dictionary = self.get_bot_info()
-        pickle.dump(dictionary, open(self.file, 'wb'))
+        for partition in list(self.partitions.values()):
+            if partition.is_dirty():
+                self.__write_snapshot(partition, self.__take_snapshot(partition))
+        self.__retire_stale_files()
+
+    async def save_now(self):
+        """
+        Takes a snapshot of each changed partition on the event loop and writes
+        them on their own save threads so commands don't wait on the disk
+        """
+        saved = await asyncio.gather(*[
+            self.__save_partition(partition)
+            for partition in list(self.partitions.values()) if partition.is_dirty()
+        ])
+        if all(saved):
+            self.__retire_stale_files()
+
+    async def __save_partition(self, partition: Partition) -> bool:
+        """
+        Helper that saves one partition
+
+        Returns:
+            bool: True if it got written
+        """
+        dictionary = self.__take_snapshot(partition)
+        try:
+            await asyncio.get_event_loop().run_in_executor(partition.executor, self.__write_snapshot, partition, dictionary)
+            return True
+        except Exception as e:
+            # nothing got written, try again next time around
+            partition.dirty = True
+            partition.dirty_guilds.update(config['guild_id'] for config in dictionary.get('guilds', []))
+            partition.dirty_msgs.update(record[0] for record in dictionary.get('running_msgs', []))
+            partition.dirty_msgs.update(dictionary.get('removed_msgs', []))
+            partition.dirty_rules.update(record[0] for record in dictionary.get('recurring', []))
+            partition.dirty_rules.update(dictionary.get('removed_recurring', []))
+            if self.print_statements:
+                print("failed to save file :/", partition.store.file)
+                print(e)
+            return False
+
+    def __retire_stale_files(self):
+        """
+        Helper that moves save files from an old shard layout out of the way,
+        only called once everything in them has been saved to the new layout
+        """
+        stale, self.__stale_files = self.__stale_files, []
+        for file in stale:
+            try:
+                os.replace(file, file + '.resharded')
+            except Exception as e:
+                if self.print_statements:
+                    print("failed to retire", file)
+                    print(e)
+
+    def __take_snapshot(self, partition: Partition) -> dict:
+        """
+        Helper that collects what needs saving and clears the dirty flags
+        """
+        if partition.store.incremental:
+            return self.get_bot_changes(partition)
+        # cleared before the snapshot so changes made while saving get picked up next time
+        partition.dirty = False
+        partition.dirty_msgs = set()
+        partition.dirty_guilds = set()
+        partition.dirty_rules = set()
+        return self.get_bot_info(partition)
+
+    def __write_snapshot(self, partition: Partition, dictionary: dict):
+        """
+        Helper that hands a snapshot to the partition's store, safe to run off the event loop
+        """
+        start = time.perf_counter()
+        rejected = partition.store.save(dictionary)
+        took = time.perf_counter() - start
+        self.__save_time.observe(took, partition.shard_id)
         if self.print_statements:
-            print("File saved")
-            pprint(dictionary)
-    
-    def get_bot_info(self) -> dict:
-        for rmsg in self.running_msgs:
-            if rmsg.is_complete():
-                self.running_msgs.pop(self.running_msgs.index(rmsg))
+            print("File saved in", round(took, 4), "seconds,", partition.store.size(), "bytes", partition.store.file)
+            # these would only fail again, so they aren't marked dirty for another try
+            for record in rejected:
+                print("couldn't save", record)
+
+    def get_bot_info(self, partition: Partition = None) -> dict:
+        """
+        Args:
+            partition (Partition): only include this partition's guilds and messages,
+                leave it out for everything
+
+        Returns:
+            dict: 'version', bot-wide settings, 'guilds' settings, 'running_msgs' records
+                and 'recurring' rule records
+        """
+        partitions = [partition] if partition else self.all_partitions()
+        shard_ids = set(part.shard_id for part in partitions)
+        dictionary = self.__get_bot_settings()
+        dictionary['guilds'] = [
+            config.to_dictionary() for config in self.configs.values() if self.shard_of(config.guild_id) in shard_ids
+        ]
+        dictionary['running_msgs'] = []
+        for part in partitions:
+            part.running_msgs.prune()
+            records = (rmsg.to_record() for rmsg in part.running_msgs)
+            dictionary['running_msgs'].extend(record for record in records if record is not None)
+        dictionary['recurring'] = [rule.to_record() for part in partitions for rule in part.rules.values()]
+        return dictionary
+
+    def __get_bot_settings(self) -> dict:
+        """
+        Helper that collects the bot-wide settings and guild defaults
+        """
         dictionary = {}
-        dictionary['permitted_roles'] = copy.deepcopy(self.permitted_roles)
-        dictionary['threshold'] = copy.deepcopy(self.threshold)
-        dictionary['base_command'] = copy.deepcopy(self.base_command)
-        dictionary['reaction_str'] = copy.deepcopy(self.reaction_str)
-        dictionary['pinging'] = copy.deepcopy(self.pinging)
-        dictionary['running_msgs'] = copy.deepcopy([rmsg.to_dictionary() for rmsg in self.running_msgs])
-        dictionary['save_timer'] = copy.deepcopy(self.save_timer)
-        dictionary['max_event_time'] = copy.deepcopy(self.max_event_time)
+        dictionary['version'] = SCHEMA_VERSION
+        # everything in here is immutable apart from the lists, which get copied
+        dictionary['permitted_roles'] = list(self.permitted_roles)
+        dictionary['threshold'] = self.threshold
+        dictionary['base_command'] = self.base_command
+        dictionary['reaction_str'] = self.reaction_str
+        dictionary['pinging'] = self.pinging
+        dictionary['timezones'] = [list(zone) for zone in self.timezones]
+        dictionary['save_timer'] = self.save_timer
+        dictionary['max_event_time'] = self.max_event_time
+        dictionary['max_open_events'] = self.max_open_events
+        dictionary['rehydrate_concurrency'] = self.rehydrate_concurrency
+        dictionary['rehydrate_window'] = self.rehydrate_window
+        dictionary['ping_batch_window'] = self.pings.window
         return dictionary
 
-    def __save_loop(self):
+    def get_bot_changes(self, partition: Partition) -> dict:
+        """
+        Like `get_bot_info` but only with what changed in a partition since its last save
+
+        Returns:
+            dict: bot-wide settings if they changed, 'guilds' whose settings changed,
+                'running_msgs' that need writing and 'removed_msgs' ids that are no longer running,
+                'recurring' and 'removed_recurring' the same for recurring events
+        """
+        dictionary = {}
+        if partition.dirty:
+            partition.dirty = False
+            dictionary = self.__get_bot_settings()
+        dirty_guilds, partition.dirty_guilds = partition.dirty_guilds, set()
+        dictionary['guilds'] = [
+            self.configs[guild_id].to_dictionary() for guild_id in dirty_guilds if guild_id in self.configs
+        ]
+        dirty_msgs, partition.dirty_msgs = partition.dirty_msgs, set()
+        partition.running_msgs.prune()
+        dictionary['running_msgs'] = []
+        dictionary['removed_msgs'] = []
+        for msg_id in dirty_msgs:
+            rmsg = partition.running_msgs.get(msg_id)
+            if rmsg and rmsg.msg_id is not None:
+                dictionary['running_msgs'].append(rmsg.to_record())
+            else:
+                dictionary['removed_msgs'].append(msg_id)
+        dirty_rules, partition.dirty_rules = partition.dirty_rules, set()
+        dictionary['recurring'] = []
+        dictionary['removed_recurring'] = []
+        for rule_id in dirty_rules:
+            rule = partition.rules.get(rule_id)
+            if rule:
+                dictionary['recurring'].append(rule.to_record())
+            else:
+                dictionary['removed_recurring'].append(rule_id)
+        return dictionary
+
+    def event_template(self, success_msg: str, failed_msg: str, partition: Partition) -> EventTemplate:
+        """
+        Gets the template shared by every event in a partition with these texts, making it if needed
+
+        Args:
+            success_msg (str): message string for success
+            failed_msg (str): message string for failure
+            partition (Partition): partition the events belong to
+
+        Returns:
+            EventTemplate: the shared template
+        """
+        key = (success_msg, failed_msg)
+        template = partition.templates.get(key)
+        if template is None:
+            template = partition.templates[key] = EventTemplate(
+                success_msg,
+                failed_msg,
+                partition.scheduler,
+                self.outbound,
+                partition.running_msgs,
+                self.get_channel,
+                self.materialize,
+                self.pings
+            )
+        return template
+
+    def __arm_rule(self, rule: RecurringRule):
+        """
+        Helper that schedules posting a rule's next occurrence, `recurring_lead` before it starts
+        """
+        post_at = max(time.time(), rule.next_at - self.recurring_lead)
+        rule.timer = self.partition(rule.guild_id).scheduler.schedule(post_at, partial(self.__post_occurrence, rule))
+
+    async def __post_occurrence(self, rule: RecurringRule):
+        """
+        Posts a rule's next occurrence as a regular event and schedules the one after it
+        """
+        rule.timer = None
+        partition = self.partition(rule.guild_id)
+        if partition.rules.get(rule.rule_id) is not rule:
+            return
+        now = time.time()
+        channel = self.get_channel(rule.channel_id)
+        # anything missed while the bot was offline is skipped, and so is this one if the
+        # channel isn't cached (EG: the guild is unavailable), deleted channels drop the rule
+        if rule.next_at > now and channel is not None:
+            config = self.get_config(rule.guild_id)
+            try:
+                if not self.__at_capacity(config):
+                    self.__open_event(channel, config, timedelta(seconds=int(rule.next_at - now)))
+            except Exception as e:
+                if self.print_statements:
+                    print("failed to post recurring event", rule.rule_id)
+                    print(e)
+        rule.next_at = rule.next_after(max(now, rule.next_at))
+        partition.dirty_rules.add(rule.rule_id)
+        self.__arm_rule(rule)
+
+    def drop_rule(self, rule_id: int) -> RecurringRule:
+        """
+        Stops a recurring event, must be called from the event loop
+
+        Events it already posted keep running
+
+        Args:
+            rule_id (int): id of the rule
+
+        Returns:
+            RecurringRule: the dropped rule or None
+        """
+        for partition in list(self.partitions.values()):
+            rule = partition.rules.pop(rule_id, None)
+            if rule:
+                if rule.timer:
+                    partition.scheduler.cancel(rule.timer)
+                    rule.timer = None
+                partition.dirty_rules.add(rule_id)
+                return rule
+        return None
+
+    def drop_running_msg(self, msg_id: int) -> ReactiveMessage:
+        """
+        Stops and untracks a running message, must be called from the event loop
+
+        Args:
+            msg_id (int): discord message id
+
+        Returns:
+            ReactiveMessage: the dropped message or None
+        """
+        for partition in list(self.partitions.values()):
+            rmsg = partition.running_msgs.get(msg_id)
+            if rmsg:
+                rmsg.stop()
+            removed = partition.running_msgs.remove(msg_id)
+            if removed:
+                return removed
+        return None
+
+    async def __save_loop(self):
         while True:
-            time.sleep(self.save_timer)
-            self.try_saving()
+            await asyncio.sleep(self.save_timer)
+            if self.is_dirty():
+                await self.save_now()
 
-    def get_role(self, id: int) -> discord.Role:
+    def get_role(self, id: int, guild_id: int = None) -> discord.Role:
         """
         Helper function that gets discord role object from id
 
         Args:
             id (int): role ID
+            guild_id (int): guild the role belongs to, if known
 
         Returns:
             discord.Role : discord role object
         """
-        for role in self.roles:
-            if role.id == id:
-                return role
+        if guild_id is not None:
+            return self.roles.get(guild_id, {}).get(id)
+        for guild_roles in self.roles.values():
+            if id in guild_roles:
+                return guild_roles[id]
         return None
 
+    def index_guild_roles(self, guild: discord.Guild):
+        """
+        Helper function that (re)builds the role index of a guild
+
+        Args:
+            guild (discord.Guild): guild to index
+        """
+        self.roles[guild.id] = {role.id: role for role in guild.roles}
+
+    async def on_guild_join(self, guild: discord.Guild):
+        self.index_guild_roles(guild)
+
+    async def on_guild_remove(self, guild: discord.Guild):
+        self.roles.pop(guild.id, None)
+        self.renderer.forget(guild.id)
+        # none of them can be posted to or fetched anymore, parked ones would be retried forever
+        for rmsg in self.partition(guild.id).running_msgs.select(EventSelector(guild_id=guild.id)):
+            self.drop_running_msg(rmsg.msg_id)
+        for rule in list(self.partition(guild.id).rules.values()):
+            if rule.guild_id == guild.id:
+                self.drop_rule(rule.rule_id)
+
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        for rule in list(self.partition(channel.guild.id).rules.values()):
+            if rule.channel_id == channel.id:
+                self.drop_rule(rule.rule_id)
+
+    async def on_guild_role_create(self, role: discord.Role):
+        self.roles.setdefault(role.guild.id, {})[role.id] = role
+
+    async def on_guild_role_update(self, before: discord.Role, after: discord.Role):
+        self.roles.setdefault(after.guild.id, {})[after.id] = after
+
+    async def on_guild_role_delete(self, role: discord.Role):
+        self.roles.get(role.guild.id, {}).pop(role.id, None)
+
     def __del__(self):
-        self.try_saving()
+        if self.is_dirty():
+            self.try_saving()
+
+
+class ShardedPlayBot(PlayBot, discord.AutoShardedClient):
+    """
+    PlayBot on an auto-sharded gateway connection
+
+    Every shard's guilds get their own partition of the bot's state,
+    so more guilds means more partitions instead of one bigger one
+    """
+    sharded = True
+
+    def partition_count(self) -> int:
+        # only known once connected, nothing gets partitioned before then
+        return self.shard_count or 1
 
 
 def main():
@@ -1,55 +1,299 @@
 from bot import PlayBot
-from message_manager import ReactiveMessage
+from command_parser import CommandRegistry, CommandError, Arg, tokenize
+from render import zone_list
+from tracking import event_selector
+from profiling import Profiler
 from pprint import pprint
-from threading import Thread
+from threading import Thread, Event
+from contextlib import redirect_stdout
+from datetime import timedelta
+import io
+import os
+import socket
 import sys
-import re
-import pickle
+import asyncio
+
+# how many messages `list` shows at a time
+LIST_PAGE = 20
+# where the control socket is made, EG: `CONTROL_SOCKET=/run/playbot.sock`
+DEFAULT_SOCKET = "./playbot.sock"
 
 class BotTerminal:
     """
     This is used to run in parallel to the bot to manually control some of it's features in real time
 
-    If someone wanted, since files are save pretty often you can call a subprocess and retain 
+    Commands are typed into the terminal or sent over a Unix socket (`CONTROL_SOCKET`),
+    either way they run on the bot's event loop so they never race with it
+
+    If someone wanted, since files are save pretty often you can call a subprocess and retain
     most of the functionallity with all the printouts and debugging tools
 
     This includes shutting the bot down safely
     """
     terminal_running = False
-    str_pattern = "\'.*?\'|\".*?\"|\(.*?\)|[a-zA-Z\d\_\*\-\\\+\/\[\]\?\!\@\#\$\%\&\=\~\`]+"
-    pattern = None
+    guild_help = "Add a guild id to only change that guild, otherwise the default and every guild changes"
+    selector_help = (
+        "Filters are channel=<id>, guild=<id>, due=<time> (deadline within) and older=<time> (posted before),\n"
+        "times are 'd:h:m', 'h:m' or 'm', every filter given has to match, `all` matches everything")
 
     def __init__(self, playbot: PlayBot):
         self.bot = playbot
-        self.pattern = re.compile(self.str_pattern)
-        self.execute = {
-            'help': self.help_command,
-            'real-info': self.print_bot_command,
-            'saved-info': self.print_file_contents_command,
-            'save-timer': self.adjust_save_timer_command,
-            'pass': self.force_msg_success_command,
-            'fail': self.force_msg_failed_command,
-            'del-msg': self.del_msg_command,
-            'rename-base': self.rename_base_cmd_command,
-            'permit-role': self.add_permitted_role_command,
-            'remove-role': self.remove_permitted_role_command,
-            'max-time': self.adjust_max_time_command,
-            'reaction': self.adjust_reaction_command,
-            'ping': self.adjust_ping_role_command,
-            'count': self.adjust_threshold_command,
-            'save-now': self.save_bot_now_command,
-            'exit': None
-        }
+        self.profiler = Profiler()
+        self.socket_path = os.getenv('CONTROL_SOCKET', DEFAULT_SOCKET)
+        self.__server = None
+        self.__loop = None
+        # set once the bot's event loop is running and can take commands
+        self.__ready = Event()
+        # one command at a time, whether it came from the terminal or the socket
+        self.__lock = asyncio.Lock()
+        self.execute = CommandRegistry()
+        self.execute.register(
+            'help', self.help_command,
+            help="Lists every command")
+        self.execute.register(
+            'real-info', self.print_bot_command,
+            help="This command pretty-prints class variables of the bot\n"
+            "Example: real-info\n"
+            "Would print the contents")
+        self.execute.register(
+            'saved-info', self.print_file_contents_command,
+            help="This command pretty-prints the contents of the save file, one per shard when sharded\n"
+            "Example: saved-info\n"
+            "Would print the contents")
+        self.execute.register(
+            'save-timer', self.adjust_save_timer_command, [Arg('seconds', int)],
+            help="This command takes an integer in seconds and adjusts the frequency of saving\n"
+            "Example: save-timer 30\n"
+            "Would now set the bot to save every 30 seconds")
+        self.execute.register(
+            'rehydrate-limit', self.adjust_rehydrate_limit_command, [Arg('count', int)],
+            help="This command takes an integer and adjusts how many saved messages\n"
+            "get fetched at the same time when the bot starts up\n"
+            "Example: rehydrate-limit 10\n"
+            "Would fetch up to 10 messages at once on the next start")
+        self.execute.register(
+            'rehydrate-window', self.adjust_rehydrate_window_command, [Arg('seconds', int)],
+            help="This command takes an integer in seconds, saved messages due further out than that\n"
+            "are only fetched once they get that close or someone reacts to them\n"
+            "Example: rehydrate-window 600\n"
+            "Would fetch only messages due in the next 10 minutes on the next start")
+        self.execute.register(
+            'list', self.list_msgs_command, [Arg('msg ids/filters', event_selector, optional=True, rest=True)],
+            help="This command lists running messages, soonest deadline first, " + str(LIST_PAGE) + " at a time\n"
+            "Example: list guild=123456 page=2\n"
+            "Would show the second page of messages in the guild `123456`\n" + self.selector_help)
+        self.execute.register(
+            'pass', self.force_msg_success_command, [Arg('msg ids/filters', event_selector, rest=True)],
+            help="This command takes message ids or filters\n"
+            "and immediately assumes those messages were successful\n"
+            "Example: pass 123456 654321\n"
+            "Would now pass the messages `123456` and `654321` and ping\n" + self.selector_help)
+        self.execute.register(
+            'fail', self.force_msg_failed_command, [Arg('msg ids/filters', event_selector, rest=True)],
+            help="This command takes message ids or filters\n"
+            "and immediately assumes time has elapsed for those messages\n"
+            "Example: fail channel=123456 due=30\n"
+            "Would now fail every message in the channel `123456` due in the next 30 minutes\n" + self.selector_help)
+        self.execute.register(
+            'del-msg', self.del_msg_command, [Arg('msg ids/filters', event_selector, rest=True)],
+            help="This command drops currently-tracked messages without any follow up\n"
+            "Example: del-msg guild=123456 older=2:0:0\n"
+            "Would delete every message in the guild `123456` posted more than 2 days ago from the tracking list\n"
+            + self.selector_help)
+        self.execute.register(
+            'rename-base', self.rename_base_cmd_command, [Arg('base', str), Arg('guild id', int, optional=True)],
+            help="This command takes a string and adjusts base command to use in discord\n"
+            "Example: rename-base \"!Let's Play\"\n"
+            "Would now require all commands on discord to start with `!Let's Play`\n" + self.guild_help)
+        self.execute.register(
+            'permit-role', self.add_permitted_role_command, [Arg('role id', int), Arg('guild id', int, optional=True)],
+            help="This command takes an integer that represents a role and adds it\n"
+            "into the roles the bot would listen too\n"
+            "Example: permit-role 123456\n"
+            "Would now add the role `123456`\n" + self.guild_help)
+        self.execute.register(
+            'remove-role', self.remove_permitted_role_command, [Arg('role id', int), Arg('guild id', int, optional=True)],
+            help="This command takes an integer that represents a role and removes it\n"
+            "from the roles the bot would listen too\n"
+            "Example: remove-role 123456\n"
+            "Would now remove the role `123456`\n" + self.guild_help)
+        self.execute.register(
+            'max-time', self.adjust_max_time_command, [Arg('seconds', int)],
+            help="This command takes an integer in seconds and\n"
+            "adjusts the max future event time\n"
+            "Example: max-time 120\n"
+            "Would now set the maximum forward time to 2 minutes")
+        self.execute.register(
+            'max-events', self.adjust_max_events_command, [Arg('count', int)],
+            help="This command takes an integer and adjusts how many events\n"
+            "a guild can have running at once\n"
+            "Example: max-events 50\n"
+            "Would now turn away new events in a guild that already has 50 going")
+        self.execute.register(
+            'ping-batch', self.adjust_ping_batch_command, [Arg('seconds', float)],
+            help="This command takes a number of seconds, success pings in the same channel\n"
+            "that come within that long of each other go out as one message, 0 turns it off\n"
+            "Example: ping-batch 2\n"
+            "Would now merge events in a channel that pass within 2 seconds of the first one")
+        self.execute.register(
+            'reaction', self.adjust_reaction_command, [Arg('emoji', str), Arg('guild id', int, optional=True)],
+            help="This command takes a string and adjusts the emoji used to react with\n"
+            "Example: reaction :123:\n"
+            "Would now ask users to react with the emoji :123:\n" + self.guild_help)
+        self.execute.register(
+            'ping', self.adjust_ping_role_command, [Arg('role id', int), Arg('guild id', int, optional=True)],
+            help="This command takes an integer and adjusts who will be pinged\n"
+            "Example: ping 123456\n"
+            "Would now ping the role associated to '123456'\n" + self.guild_help)
+        self.execute.register(
+            'count', self.adjust_threshold_command, [Arg('integer', int), Arg('guild id', int, optional=True)],
+            help="This command takes an integer and adjusts the max\n"
+            "number participants require to issue a ping\n"
+            "Example: count 7\n"
+            "Would move the threshold/count to 7 before pinging\n" + self.guild_help)
+        self.execute.register(
+            'zones', self.adjust_zones_command, [Arg('zone,zone,...', zone_list), Arg('guild id', int, optional=True)],
+            help="This command takes a comma separated list of timezones to show event times in\n"
+            "Example: zones America/New_York,Europe/London\n"
+            "Would now show every event time in New York and London time\n" + self.guild_help)
+        self.execute.register(
+            'stats', self.print_stats_command,
+            help="This command prints the bot's counters and timings\n"
+            "Example: stats\n"
+            "Would print how many commands, reactions, API calls and saves the bot has handled and how long they took")
+        self.execute.register(
+            'lag', self.print_lag_command, [Arg('stalls', int, optional=True)],
+            help="This command prints how late the bot's event loop has been getting to things\n"
+            "and the stacks of the latest times something blocked it\n"
+            "Example: lag 5\n"
+            "Would print the lag histogram and the stacks of the last 5 stalls")
+        self.execute.register(
+            'profile-start', self.profile_start_command,
+            help="This command starts cProfile on the bot's event loop\n"
+            "Example: profile-start\n"
+            "Would profile everything the bot does until `profile-stop`")
+        self.execute.register(
+            'profile-stop', self.profile_stop_command, [Arg('top', int, optional=True)],
+            help="This command stops cProfile, writes the profile into " + self.profiler.out_dir + "\n"
+            "and prints the most expensive functions\n"
+            "Example: profile-stop 30\n"
+            "Would print the top 30 functions by cumulative time")
+        self.execute.register(
+            'mem-snap', self.memory_snapshot_command, [Arg('top', int, optional=True)],
+            help="This command takes a tracemalloc snapshot and writes it into " + self.profiler.out_dir + "\n"
+            "The first one starts tracing, each one after prints what grew since the one before\n"
+            "Example: mem-snap 10\n"
+            "Would print the 10 biggest changes since the last snapshot")
+        self.execute.register(
+            'mem-stop', self.memory_stop_command,
+            help="This command stops tracemalloc, memory tracing slows the bot down while it's on")
+        self.execute.register(
+            'tasks', self.dump_tasks_command,
+            help="This command writes the stack of every task on the bot's event loop\n"
+            "into " + self.profiler.out_dir + ", event tasks first\n"
+            "Example: tasks\n"
+            "Would list every task and write their stacks to a file")
+        self.execute.register(
+            'save-now', self.save_bot_now_command,
+            help="This command writes the current bot info into the save file\n"
+            "Example: save-now\n"
+            "Would save the bot status immediately")
+        self.execute.register(
+            'exit', None,
+            help="Closes the terminal or control socket connection (This does not shutdown the bot)")
 
     def start(self):
         """
         Begins bot on main thread and starts terminal on another
 
+        The terminal thread only reads lines, every command is handed to the bot's
+        event loop and runs there, same as commands sent over the control socket
+
         'exit' will close terminal thread
         """
-        Thread(target=self.__start_terminal_thread).start()
+        self.bot.startup_hooks.append(self.serve)
+        Thread(target=self.__start_terminal_thread, daemon=True).start()
         self.bot.initialize()
-    
+
+    async def serve(self):
+        """
+        Starts the control socket on the running event loop
+
+        Every connection gets one command per line, the output of each command is
+        sent back followed by a line with a single '.', output lines that start with
+        a '.' get another one put in front. Lines starting with '#' are skipped,
+        so a whole script can be piped in, EG: `python bot_terminal.py script.txt`
+        """
+        self.__loop = asyncio.get_running_loop()
+        self.__ready.set()
+        if self.__server or not hasattr(asyncio, 'start_unix_server'):
+            return
+        try:
+            if os.path.exists(self.socket_path):
+                # left behind by a bot that didn't shut down cleanly
+                os.remove(self.socket_path)
+            self.__server = await asyncio.start_unix_server(self.__handle_client, path=self.socket_path)
+            # only the user running the bot gets to control it
+            os.chmod(self.socket_path, 0o600)
+        except Exception as e:
+            if self.bot.print_statements:
+                print("failed to start control socket :/")
+                print(e)
+
+    async def __handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                line = line.decode(errors='replace').strip()
+                if not line or line.startswith('#'):
+                    continue
+                if line == 'exit':
+                    break
+                output = await self.run_line(line)
+                for out in output.splitlines():
+                    writer.write((('.' + out) if out.startswith('.') else out).encode() + b'\n')
+                writer.write(b'.\n')
+                # waits on slow readers instead of buffering a whole script's output
+                await writer.drain()
+        except Exception as e:
+            if self.bot.print_statements:
+                print("control socket client failed")
+                print(e)
+        finally:
+            writer.close()
+
+    async def run_line(self, line: str) -> str:
+        """
+        Runs one terminal command on the event loop
+
+        Commands run one at a time, so a script can't interleave with the
+        terminal or another connection halfway through a command.
+        stdout is only redirected while nothing else can run, so an async
+        command's own output has to go through the returned text, not print
+
+        Args:
+            line (str): command line, EG: 'count 7 123456'
+
+        Returns:
+            str: everything the command printed
+        """
+        async with self.__lock:
+            out = io.StringIO()
+            # redirect_stdout swaps sys.stdout for the whole process, so it
+            # can't be held across an await or other tasks' prints end up in here
+            with redirect_stdout(out):
+                pending = self.__commands(tokenize(line))
+            if pending is not None:
+                try:
+                    await pending
+                except Exception as e:
+                    print("Command failed:", file=out)
+                    print(e, file=out)
+                print(file=out)
+            return out.getvalue()
+
     def __start_terminal_thread(self):
         if not self.bot.print_statements_enabled():
             # Thread(target=self.__terminal_loop).start()
@@ -62,283 +306,215 @@ class BotTerminal:
         print("Terminal started\n")
         while self.terminal_running:
             print(">", end="", flush=True)
-            line = sys.stdin.readline().rstrip()
-            if line == 'exit':
+            line = sys.stdin.readline()
+            if not line or line.rstrip() == 'exit':
                 self.terminal_running = False
             else:
-                argv = self.__handle_line(line)
-                self.__commands(argv)
-            print()
+                print(self.__forward(line.rstrip()))
         print("Terminal closed")
         print("Joining bot thread and enabling print outs")
         self.bot.enable_print_statements(True)
         self.bot.join_bot_thread()
 
-    def __handle_line(self, line: str):
+    def __forward(self, line: str) -> str:
+        """
+        Hands a line typed into the terminal to the event loop and waits for its output
         """
-        Helper that tokenizes line into an argument vector
+        # nothing can run until the bot has a loop going
+        self.__ready.wait()
+        return asyncio.run_coroutine_threadsafe(self.run_line(line), self.__loop).result()
 
-        Args:
-            line (str): a command straight off the command line
+    def __commands(self, argv: list):
+        """
+        Runs a command
 
         Returns:
-            argv [list]: Contains each seperate word
+            coroutine: what's left of an async command for the caller to await, else None
         """
-        if not self.pattern:
-            self.pattern = re.compile(self.str_pattern)
-        argv = []
-        none_matched = True
-        for match in re.finditer(self.pattern, line):
-            if none_matched:
-                none_matched = False
-            argv.append(match.group(0).rstrip())
-        if none_matched:
-            argv.append(line)
-        return argv
-
-    def __commands(self, argv: list):
-        command = argv[0]
-        if command in self.execute.keys():
+        command, tokens = self.execute.lookup(argv)
+        if command is None or command.handler is None:
+            print("Sorry, I didn't understand that")
+            self.help_command()
+        elif tokens and tokens[0] == '-h':
+            print("usage:", command.usage())
+            print(command.help)
+        else:
             try:
-                self.execute[command](argv)
+                result = command.handler(*command.convert(tokens))
+                if asyncio.iscoroutine(result):
+                    return result
+            except CommandError as e:
+                print(e)
             except Exception as e:
                 print("Command failed:")
                 print(e)
-        else:
-            print("Sorry, I didn't understand that")
-            self.execute['help'](argv)
         print()
 
-    def help_command(self, argv: list):
+    def help_command(self):
         print("Availible commands are:")
-        for k in self.execute.keys():
+        for k in self.execute.names():
             print('\t', k)
         print("use the '-h' flag on a command to see further instructions")
         print("To quit terminal, simply type `exit` (This does not shutdown the bot).")
 
-    def adjust_threshold_command(self, argv: list):
-        if len(argv) > 1 and argv[1] == '-h':
-            print(
-                "This command takes an integer and adjusts the max\n",
-                "number participants require to issue a ping\n",
-                "Example: count 7\n",
-                "Would move the threshold/count to 7 before pinging"
-            )
-        else:
-            try:
-                self.bot.threshold = int(argv[1])
-            except Exception as e:
-                print("Command failed:")
-                print(e)
+    def adjust_threshold_command(self, count: int, guild_id: int):
+        self.bot.set_config('threshold', count, guild_id)
 
-    def adjust_ping_role_command(self, argv: list):
-        if len(argv) > 1 and argv[1] == '-h':
-            print(
-                "This command takes an integer and adjusts who will be pinged\n",
-                "Example: ping 123456\n",
-                "Would now ping the role associated to '123456'"
-            )
-        else:
-            try:
-                self.bot.pinging = int(argv[1])
-            except Exception as e:
-                print("Command failed:")
-                print(e)
+    def adjust_ping_role_command(self, role_id: int, guild_id: int):
+        self.bot.set_config('pinging', role_id, guild_id)
 
-    def adjust_reaction_command(self, argv: list):
-        if len(argv) > 1 and argv[1] == '-h':
-            print(
-                "This command takes a string and adjusts the emoji used to react with\n",
-                "Example: reaction :123:\n",
-                "Would now ask users to react with the emoji :123:"
-            )
-        else:
-            try:
-                #strips outer qoutes
-                if '\'' in argv[1][0]:
-                    argv[1] = argv[1][1:-1]
-                elif '\"' in argv[1][0]:
-                    argv[1] = argv[1][1:-1]
-                self.bot.reaction_str = argv[1]
-            except Exception as e:
-                print("Command failed:")
-                print(e)
+    def adjust_reaction_command(self, emoji: str, guild_id: int):
+        self.bot.set_config('reaction_str', emoji, guild_id)
 
-    def adjust_max_time_command(self, argv: list):
-        if len(argv) > 1 and argv[1] == '-h':
-            print(
-                "This command takes an integer in seconds and\n",
-                "adjusts the max future event time\n",
-                "Example: max-time 120\n",
-                "Would now set the maximum forward time to 2 minutes"
-            )
-        else:
-            try:
-                self.bot.max_event_time = int(argv[1])
-            except Exception as e:
-                print("Command failed:")
-                print(e)
+    def adjust_zones_command(self, zones: list, guild_id: int):
+        self.bot.set_config('timezones', zones, guild_id)
 
-    def rename_base_cmd_command(self, argv: list):
-        if len(argv) > 1 and argv[1] == '-h':
-            print(
-                "This command takes a string and adjusts base command to use in discord\n",
-                "Example: rename-base \"!Let's Play\"\n",
-                "Would now require all commands on discord to start with `!Let's Play`"
-            )
-        else:
-            try:
-                if '\'' in argv[1][0]:
-                    argv[1] = argv[1][1:-1]
-                elif '\"' in argv[1][0]:
-                    argv[1] = argv[1][1:-1]
-                self.bot.base_command = argv[1]
-            except Exception as e:
-                print("Command failed:")
-                print(e)
+    def adjust_max_time_command(self, seconds: int):
+        self.bot.max_event_time = seconds
+        self.bot.mark_dirty()
 
-    def remove_permitted_role_command(self, argv: list):
-        if len(argv) > 1 and argv[1] == '-h':
-            print(
-                "This command takes an integer that represents a role and removes it\n",
-                "from the roles the bot would listen too\n",
-                "Example: remove-role 123456\n",
-                "Would now remove the role `123456`"
-            )
-        else:
-            try:
-                role_id = int(argv[1])
-                if role_id in self.bot.permitted_roles:
-                    self.bot.permitted_roles.pop(self.bot.permitted_roles.index(role_id))
-            except Exception as e:
-                print("Command failed:")
-                print(e)
+    def adjust_max_events_command(self, count: int):
+        self.bot.max_open_events = max(1, count)
+        self.bot.mark_dirty()
 
-    def add_permitted_role_command(self, argv: list):
-        if len(argv) > 1 and argv[1] == '-h':
-            print(
-                "This command takes an integer that represents a role and adds it\n",
-                "into the roles the bot would listen too\n",
-                "Example: permit-role 123456\n",
-                "Would now add the role `123456`"
-            )
-        else:
-            try:
-                role_id = int(argv[1])
-                if role_id not in self.bot.permitted_roles:
-                    self.bot.permitted_roles.append(role_id)
-            except Exception as e:
-                print("Command failed:")
-                print(e)
+    def adjust_ping_batch_command(self, seconds: float):
+        self.bot.pings.window = max(0, seconds)
+        self.bot.mark_dirty()
 
-    def force_msg_failed_command(self, argv: list):
-        if len(argv) > 1 and argv[1] == '-h':
-            print(
-                "This command takes an integer that represents a msg id\n",
-                "and immediately assumes time has elapsed\n",
-                "Example: fail 123456\n",
-                "Would now fail the message `123456`"
-            )
-        else:
-            try:
-                msg_id = int(argv[1])
-                for i in range(0, len(self.bot.running_msgs)):
-                    if self.bot.running_msgs[i].get_msg().id == msg_id:
-                        self.bot.running_msgs[i].delay = 0
-            except Exception as e:
-                print("Command failed:")
-                print(e)
+    def rename_base_cmd_command(self, base: str, guild_id: int):
+        self.bot.set_config('base_command', base, guild_id)
 
-    def force_msg_success_command(self, argv: list):
-        if len(argv) > 1 and argv[1] == '-h':
-            print(
-                "This command takes an integer that represents a msg id\n",
-                "and immediately assumes it was successful\n",
-                "Example: pass 123456\n",
-                "Would now pass the message `123456` and ping"
-            )
-        else:
-            try:
-                msg_id = int(argv[1])
-                for i in range(0, len(self.bot.running_msgs)):
-                    if self.bot.running_msgs[i].get_msg().id == msg_id:
-                        self.bot.running_msgs[i].threshold = 0
-            except Exception as e:
-                print("Command failed:")
-                print(e)
+    def remove_permitted_role_command(self, role_id: int, guild_id: int):
+        self.bot.permit_role(role_id, False, guild_id)
 
-    def adjust_save_timer_command(self, argv: list):
-        if len(argv) > 1 and argv[1] == '-h':
-            print(
-                "This command takes an integer in seconds and adjusts the frequency of saving\n",
-                "Example: save-timer 30\n",
-                "Would now set the bot to save every 30 seconds"
-            )
-        else:
-            try:
-                self.bot.save_timer = int(argv[1])
-            except Exception as e:
-                print("Command failed:")
-                print(e)
-    
-    def print_file_contents_command(self, argv: list):
-        if len(argv) > 1 and argv[1] == '-h':
-            print(
-                "This command pretty-prints the contents of the save file\n",
-                "Example: save-info\n",
-                "Would print the contents"
-            )
-        else:
-            try:
-                pprint(pickle.load(open(self.bot.file, 'rb')))
-            except Exception as e:
-                print("Command failed:")
-                print(e)
+    def add_permitted_role_command(self, role_id: int, guild_id: int):
+        self.bot.permit_role(role_id, True, guild_id)
 
-    def save_bot_now_command(self, argv: list):
-        if len(argv) > 1 and argv[1] == '-h':
-            print(
-                "This command writes the current bot info into the save file\n",
-                "Example: save-now\n",
-                "Would save the bot status immediately"
-            )
-        else:
-            try:
-                self.bot.try_saving()
-            except Exception as e:
-                print("Command failed:")
-                print(e)
+    def __select(self, selector) -> list:
+        """
+        Helper that finds the running messages a command applies to
+        """
+        if selector.is_empty():
+            raise CommandError("give message ids, filters or `all`")
+        return self.bot.running_msgs.select(selector)
 
-    def print_bot_command(self, argv: list):
-        if len(argv) > 1 and argv[1] == '-h':
-            print(
-                "This command pretty-prints class variables of the bot\n",
-                "Example: real-info\n",
-                "Would print the contents"
-            )
-        else:
-            try:
-                pprint(self.bot.get_bot_info())
-            except Exception as e:
-                print("Command failed:")
-                print("\t", e)
+    def force_msg_failed_command(self, selector):
+        rmsgs = self.__select(selector)
+        for rmsg in rmsgs:
+            rmsg.expire_now()
+        print("Failing", len(rmsgs), "msgs")
+
+    def force_msg_success_command(self, selector):
+        rmsgs = self.__select(selector)
+        loop = asyncio.get_running_loop()
+        for rmsg in rmsgs:
+            rmsg.threshold = 0
+            # the pings queue up in the bot's outbound queue, no need to hold the terminal for them
+            loop.create_task(rmsg.check_threshold())
+        print("Passing", len(rmsgs), "msgs")
+
+    def adjust_save_timer_command(self, seconds: int):
+        self.bot.save_timer = seconds
+        self.bot.mark_dirty()
+
+    def adjust_rehydrate_limit_command(self, count: int):
+        self.bot.rehydrate_concurrency = max(1, count)
+        self.bot.mark_dirty()
+
+    def adjust_rehydrate_window_command(self, seconds: int):
+        self.bot.rehydrate_window = max(0, seconds)
+        self.bot.mark_dirty()
+
+    def print_file_contents_command(self):
+        for partition in self.bot.all_partitions():
+            print(partition.store.file)
+            pprint(partition.store.load())
+
+    async def save_bot_now_command(self):
+        await self.bot.save_now()
+
+    def print_stats_command(self):
+        print(self.bot.metrics.summary())
+
+    def print_lag_command(self, stalls: int):
+        print(self.bot.watchdog.report(3 if stalls is None else stalls))
+
+    def profile_start_command(self):
+        self.profiler.start_profile()
+        print("Profiling, use `profile-stop` to finish")
+
+    def profile_stop_command(self, top: int):
+        path, summary = self.profiler.stop_profile(top or 20)
+        print(summary)
+        print("Profile written to", path)
+
+    def memory_snapshot_command(self, top: int):
+        path, summary = self.profiler.take_snapshot(top or 10)
+        print(summary)
+        print("Snapshot written to", path)
 
-    def del_msg_command(self, argv: list):
-        if len(argv) > 1 and argv[1] == '-h':
+    def memory_stop_command(self):
+        self.profiler.stop_tracing()
+        print("Memory tracing stopped")
+
+    def dump_tasks_command(self):
+        path, summary = self.profiler.dump_tasks()
+        print(summary)
+
+    def print_bot_command(self):
+        pprint(self.bot.get_bot_info())
+
+    def del_msg_command(self, selector):
+        rmsgs = self.__select(selector)
+        for rmsg in rmsgs:
+            self.bot.drop_running_msg(rmsg.msg_id)
+        print("Removed", len(rmsgs), "msgs")
+
+    def list_msgs_command(self, selector):
+        rmsgs = self.bot.running_msgs.select(selector or event_selector(''))
+        page = selector.page if selector else 1
+        pages = max(1, -(-len(rmsgs) // LIST_PAGE))
+        print(len(rmsgs), "msgs, page", page, "of", pages)
+        for rmsg in rmsgs[(page - 1) * LIST_PAGE:page * LIST_PAGE]:
             print(
-                "This command drops a currently-tracked message\n",
-                "Example: del-msg 123456\n",
-                "Would delete the message `123456` from the tracking list"
-            )
-        else:
-            try:
-                msg_id = int(argv[1])
-                for rmsg in self.bot.running_msgs:
-                    if isinstance(rmsg, ReactiveMessage) and rmsg.get_msg().id == msg_id:
-                        self.bot.running_msgs.pop(self.bot.running_msgs.index(rmsg))
-                        print("Removed msg", msg_id)
-            except Exception as e:
-                print("Command failed:")
-                print(e)
-        
-                
\ No newline at end of file
+                rmsg.msg_id,
+                "guild=" + str(rmsg.guild_id),
+                "channel=" + str(rmsg.channel_id),
+                "due in", timedelta(seconds=rmsg.get_delay_remaining()),
+                "count", str(rmsg.count) + "/" + str(rmsg.threshold))
+
+
+def send_commands(lines, path: str = DEFAULT_SOCKET, out=sys.stdout):
+    """
+    Sends commands to a running bot's control socket and writes back their output
+
+    Each command's output is read before the next one is sent
+
+    Args:
+        lines: iterable of command lines, EG: an open script file
+        path (str): the bot's control socket
+        out: where the output goes
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        replies = sock.makefile('r', encoding='utf-8', errors='replace')
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith('#') or line == 'exit':
+                continue
+            sock.sendall(line.encode() + b'\n')
+            # one at a time, a command with a lot of output can't back up the ones after it
+            for reply in replies:
+                reply = reply.rstrip('\n')
+                if reply == '.':
+                    break
+                out.write((reply[1:] if reply.startswith('.') else reply) + '\n')
+
+
+if __name__ == "__main__":
+    # python bot_terminal.py [script], reads commands from stdin without a script
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as script:
+            send_commands(script, os.getenv('CONTROL_SOCKET', DEFAULT_SOCKET))
+    else:
+        send_commands(sys.stdin, os.getenv('CONTROL_SOCKET', DEFAULT_SOCKET))
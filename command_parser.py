@@ -0,0 +1,188 @@
+import re
+from datetime import timedelta
+
+# quoted chunks stay together, everything else splits on whitespace
+TOKEN_PATTERN = re.compile(r"'.*?'|\".*?\"|\(.*?\)|\S+")
+
+
+class CommandError(Exception):
+    """
+    Raised when a command's arguments can't be turned into what it expects
+    """
+
+
+def tokenize(line: str) -> list:
+    """
+    Helper that tokenizes line into an argument vector
+
+    Args:
+        line (str): a command straight off the command line
+
+    Returns:
+        argv [list]: Contains each seperate word
+    """
+    return TOKEN_PATTERN.findall(line)
+
+
+def has_prefix(content: str, prefix: str) -> bool:
+    """
+    Checks a message for the prefix
+
+    Only the start of the message is looked at, so anything that isn't a
+    command gets turned away without scanning the whole message
+
+    Args:
+        content (str): raw message content
+        prefix (str): base command, EG: '!play'
+
+    Returns:
+        bool: True if this is a command
+    """
+    if not content.startswith(prefix):
+        return False
+    # '!playing' isn't '!play'
+    return len(content) == len(prefix) or content[len(prefix)].isspace()
+
+
+def strip_quotes(arg: str) -> str:
+    """
+    Helper that strips outer quotes off an argument
+    """
+    if len(arg) > 1 and arg[0] == arg[-1] and arg[0] in '\'"':
+        return arg[1:-1]
+    return arg
+
+
+def duration(arg: str) -> timedelta:
+    """
+    Converter for 'd:h:m', 'h:m' and 'm' time strings
+
+    Args:
+        arg (str): time string
+
+    Returns:
+        timedelta: how far into the future that is
+    """
+    split = [int(part) for part in arg.split(':')]
+    if len(split) == 1:
+        return timedelta(minutes=split[0])
+    if len(split) == 2:
+        return timedelta(hours=split[0], minutes=split[1])
+    return timedelta(days=split[0], hours=split[1], minutes=split[2])
+
+
+class Arg:
+    """
+    Describes one argument of a command
+    """
+
+    def __init__(self, name: str, kind=str, optional: bool = False, rest: bool = False):
+        """
+        Args:
+            name (str): name shown in usage
+            kind: converter applied to the string, EG: int, str or `duration`
+            optional (bool): if it can be left out, it comes through as None
+            rest (bool): takes every remaining word joined by spaces
+        """
+        self.name = name
+        self.kind = kind
+        self.optional = optional
+        self.rest = rest
+
+    def usage(self) -> str:
+        if self.optional:
+            return '[' + self.name + ']'
+        return '<' + self.name + '>'
+
+
+class Command:
+    """
+    A registered command, its handler and the arguments it takes
+    """
+
+    def __init__(self, name: str, handler, args: list, help: str, restricted: bool):
+        self.name = name
+        self.handler = handler
+        self.args = args
+        self.help = help
+        self.restricted = restricted
+
+    def usage(self) -> str:
+        return ' '.join([self.name or ''] + [arg.usage() for arg in self.args]).strip()
+
+    def convert(self, tokens: list) -> list:
+        """
+        Turns the tokens after the command name into typed arguments
+
+        Args:
+            tokens (list): argv without the command name
+
+        Returns:
+            list: converted arguments, one per `Arg`
+
+        Raises:
+            CommandError: when something is missing or doesn't convert
+        """
+        converted = []
+        for i, arg in enumerate(self.args):
+            if i >= len(tokens):
+                if not arg.optional:
+                    raise CommandError("missing " + arg.name + ", usage: " + self.usage())
+                converted.append(None)
+                continue
+            value = ' '.join(tokens[i:]) if arg.rest else strip_quotes(tokens[i])
+            try:
+                converted.append(arg.kind(value))
+            except Exception:
+                # converters are any callable, EG: `duration` overflows on huge numbers
+                raise CommandError("bad " + arg.name + " '" + value + "', usage: " + self.usage())
+        return converted
+
+
+class CommandRegistry:
+    """
+    Table of commands so dispatching is one dictionary lookup
+    """
+
+    def __init__(self):
+        self.commands = {}
+        self.default = None
+
+    def register(self, name: str, handler, args: list = None, help: str = "", restricted: bool = False):
+        """
+        Adds a command
+
+        Args:
+            name (str): the word that picks this command
+            handler: called with whatever context the caller passes plus the converted arguments
+            args (list): list of `Arg`
+            help (str): text shown for the command
+            restricted (bool): hint for callers that only some users may run it
+        """
+        self.commands[name] = Command(name, handler, args or [], help, restricted)
+
+    def set_default(self, handler, args: list = None, help: str = "", restricted: bool = False):
+        """
+        Sets the command used when the first word isn't a registered command
+        """
+        self.default = Command(None, handler, args or [], help, restricted)
+
+    def lookup(self, argv: list) -> tuple:
+        """
+        Finds the command for an argument vector
+
+        Args:
+            argv (list): tokens, starting with the command name
+
+        Returns:
+            tuple: (Command, remaining tokens), Command is None if nothing matched
+        """
+        if argv and argv[0] in self.commands:
+            return self.commands[argv[0]], argv[1:]
+        return self.default, argv
+
+    def names(self) -> list:
+        return list(self.commands.keys())
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.commands
@@ -0,0 +1,100 @@
+# (label, zone name) pairs shown under every prompt
+DEFAULT_TIMEZONES = [
+    ['Pacific Time', 'America/Los_Angeles'],
+    ['Eastern Time', 'US/Eastern'],
+    ['Central European Time', 'Europe/Madrid']
+]
+
+
+def zone_label(name: str) -> str:
+    """
+    Helper that makes a label out of a zone name, EG: 'America/New_York' -> 'New York'
+    """
+    return name.split('/')[-1].replace('_', ' ')
+
+
+class GuildConfig:
+    """
+    Settings for a single guild
+
+    The bot keeps one of these per guild id so every guild can have its own
+    base command, emoji, threshold, ping, permitted roles and timezones
+    """
+
+    def __init__(
+            self,
+            guild_id: int,
+            threshold: int,
+            pinging,
+            reaction_str: str,
+            base_command: str,
+            permitted_roles=None,
+            timezones=None
+        ):
+        """
+        Args:
+            guild_id (int): the guild these settings belong to
+            threshold (int): how many players are needed before pinging
+            pinging (int): role id to ping
+            reaction_str (str): emoji to react with
+            base_command (str): prefix for every command, EG: '!play'
+            permitted_roles (iterable): role ids allowed to change these settings
+            timezones (list): [label, zone name] pairs shown under prompts
+        """
+        self.guild_id = guild_id
+        self.threshold = threshold
+        self.pinging = pinging
+        self.reaction_str = reaction_str
+        self.base_command = base_command
+        self.permitted_roles = set(permitted_roles or [])
+        self.timezones = [list(zone) for zone in (timezones or DEFAULT_TIMEZONES)]
+
+    def is_permitted(self, member) -> bool:
+        """
+        Checks every role a member has against the permitted roles
+
+        Args:
+            member (discord.Member): who's asking
+
+        Returns:
+            bool: True if any of their roles is permitted
+        """
+        roles = getattr(member, 'roles', None)
+        if not roles or not self.permitted_roles:
+            return False
+        return not self.permitted_roles.isdisjoint(role.id for role in roles)
+
+    def to_dictionary(self) -> dict:
+        """
+        Helper function for serialization
+
+        Returns:
+            dict: representation of this class
+        """
+        dictionary = {}
+        dictionary['guild_id'] = self.guild_id
+        dictionary['threshold'] = self.threshold
+        dictionary['pinging'] = self.pinging
+        dictionary['reaction_str'] = self.reaction_str
+        dictionary['base_command'] = self.base_command
+        dictionary['permitted_roles'] = sorted(self.permitted_roles)
+        dictionary['timezones'] = [list(zone) for zone in self.timezones]
+        return dictionary
+
+
+def guild_config_builder(ref: dict) -> GuildConfig:
+    """
+    This is used for building GuildConfig after serialization
+
+    Args:
+        ref (dict): output of `GuildConfig.to_dictionary`
+    """
+    return GuildConfig(
+        guild_id=ref['guild_id'],
+        threshold=ref['threshold'],
+        pinging=ref['pinging'],
+        reaction_str=ref['reaction_str'],
+        base_command=ref['base_command'],
+        permitted_roles=ref['permitted_roles'],
+        timezones=ref.get('timezones')
+    )
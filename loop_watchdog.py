@@ -0,0 +1,148 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+from metrics import Metrics
+
+# seconds between heartbeats on the event loop
+HEARTBEAT = 0.1
+# seconds, how late a heartbeat can be
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Stall:
+    """
+    One time the event loop went quiet for longer than the watchdog's threshold
+    """
+
+    def __init__(self, started: float, stack: str):
+        """
+        Args:
+            started (float): epoch time in seconds when it was noticed
+            stack (str): what the loop's thread was running right then
+        """
+        self.started = started
+        self.stack = stack
+        # filled in once the loop gets back to the heartbeat
+        self.seconds = None
+
+    def __str__(self) -> str:
+        when = datetime.fromtimestamp(self.started).strftime("%Y-%m-%d %H:%M:%S")
+        seconds = "still blocked" if self.seconds is None else str(round(self.seconds, 3)) + "s"
+        return "loop blocked at " + when + " for " + seconds + "\n" + self.stack
+
+
+class LoopWatchdog:
+    """
+    Notices when something blocks the event loop and catches what it is
+
+    A heartbeat task records how late every beat is into a lag histogram.
+    A thread off the loop watches the beats, and once the loop has been quiet for
+    longer than `threshold` it grabs the loop thread's stack right then, so the
+    report shows the call doing the blocking instead of whatever runs after it
+    """
+
+    def __init__(self, metrics: Metrics = None, threshold: float = 0.25, keep: int = 20, on_stall=None):
+        """
+        Args:
+            metrics (Metrics): optional, records the lag histogram and a stall counter
+            threshold (float): seconds the loop can go quiet before it counts as blocked
+            keep (int): how many of the latest stalls to keep around
+            on_stall: optional callable taking a finished Stall, called on the event loop
+        """
+        self.threshold = threshold
+        self.interval = HEARTBEAT
+        self.stalls = deque(maxlen=keep)
+        self.on_stall = on_stall
+        self.max_lag = 0.0
+        self.__beat = None
+        self.__loop_thread = None
+        # the stall in progress, only ever set by the monitor thread
+        self.__current = None
+        self.__task = None
+        self.__thread = None
+        self.__stop = threading.Event()
+        self.__lag = None
+        self.__stall_count = None
+        if metrics is not None:
+            self.__lag = metrics.histogram(
+                'playbot_loop_lag_seconds', "How late the event loop got back to the watchdog's heartbeat",
+                buckets=LAG_BUCKETS)
+            self.__stall_count = metrics.counter(
+                'playbot_loop_stalls_total', "Times the event loop was blocked past the watchdog's threshold")
+
+    def start(self):
+        """
+        Starts the heartbeat on the running event loop and the monitor thread
+
+        Safe to call more than once (EG: 'on_ready' after a reconnect)
+        """
+        if self.__task and not self.__task.done():
+            return
+        self.__loop_thread = threading.get_ident()
+        self.__beat = time.monotonic()
+        self.__task = asyncio.get_event_loop().create_task(self.__heartbeat())
+        if not self.__thread or not self.__thread.is_alive():
+            self.__stop.clear()
+            self.__thread = threading.Thread(target=self.__monitor, name="loop-watchdog", daemon=True)
+            self.__thread.start()
+
+    def stop(self):
+        """
+        Stops the heartbeat and the monitor thread, must be called from the event loop
+        """
+        if self.__task:
+            self.__task.cancel()
+            self.__task = None
+        self.__stop.set()
+
+    async def __heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self.__beat = now
+            self.max_lag = max(self.max_lag, lag)
+            if self.__lag:
+                self.__lag.observe(lag)
+            stall, self.__current = self.__current, None
+            # the monitor can catch a beat that just came in, that one doesn't count
+            if stall and lag >= self.threshold:
+                stall.seconds = lag
+                self.stalls.append(stall)
+                if self.__stall_count:
+                    self.__stall_count.inc()
+                if self.on_stall:
+                    self.on_stall(stall)
+
+    def __monitor(self):
+        while not self.__stop.wait(self.threshold / 4):
+            if self.__current is not None:
+                # already caught this one
+                continue
+            if time.monotonic() - self.__beat > self.threshold + self.interval:
+                frame = sys._current_frames().get(self.__loop_thread)
+                stack = ''.join(traceback.format_stack(frame)) if frame else "(no stack)\n"
+                self.__current = Stall(time.time(), stack)
+
+    def report(self, count: int = 3) -> str:
+        """
+        Args:
+            count (int): how many of the latest stalls to show the stacks of
+
+        Returns:
+            str: lag quantiles and the latest stalls
+        """
+        lines = ["threshold " + str(self.threshold) + "s, worst lag " + str(round(self.max_lag, 3)) + "s"]
+        if self.__lag:
+            lines.extend(self.__lag.summary())
+        lines.append(str(len(self.stalls)) + " recent stalls")
+        for stall in list(self.stalls)[-count:] if count > 0 else []:
+            lines.append(str(stall))
+        if self.__current is not None:
+            lines.append(str(self.__current))
+        return '\n'.join(lines)
@@ -1,9 +1,16 @@
-from bot import PlayBot
+import os
+from dotenv import load_dotenv
+from bot import PlayBot, ShardedPlayBot
 from bot_terminal import BotTerminal    
 
 def main():
-    bot = PlayBot(print_statements=False)
+    load_dotenv()
+    if os.getenv('SHARDED'):
+        shard_count = os.getenv('SHARD_COUNT')
+        bot = ShardedPlayBot(print_statements=False, shard_count=int(shard_count) if shard_count else None)
+    else:
+        bot = PlayBot(print_statements=False)
     terminal = BotTerminal(bot).start()
     
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,157 +1,307 @@
 import discord
 import asyncio
-from datetime import datetime
-import pytz
+import time
+from scheduler import Scheduler
+from outbound import OutboundQueue, PRIORITY_PING, PRIORITY_EVENT
 
 BOT_TIME_ZONE = 'America/Los_Angeles'
-STRFTIME_FORMAT = "%d/%m/%y %H:%M:%S"
+
+
+class ChannelGone(Exception):
+    """
+    Raised when an event's channel no longer exists, as opposed to just not being cached yet
+    """
+
+
+class EventTemplate:
+    """
+    Everything that's the same for a batch of events, shared instead of copied into each one
+
+    The bot hands out one of these per success/failure text, so every event
+    only costs a reference to it
+    """
+    __slots__ = ('success', 'failed', 'scheduler', 'outbound', 'tracker', 'get_channel', 'materialize', 'pings')
+
+    def __init__(
+            self,
+            success_msg: str,
+            failed_msg: str,
+            scheduler: Scheduler,
+            outbound: OutboundQueue,
+            tracker=None,
+            get_channel=None,
+            materialize=None,
+            pings=None
+        ):
+        """
+        Args:
+            success_msg (str): message string for success
+            failed_msg (str): message string for failure
+            scheduler (Scheduler): the bot's scheduler that will wake events up
+            outbound (OutboundQueue): the bot's queue for anything sent to discord
+            tracker (EventTracker): optional tracker events report being posted/completed to
+            get_channel: callable that turns a channel id into a channel, EG: `discord.Client.get_channel`
+            materialize: coroutine function taking a parked event, expected to end up calling its `rehydrate`
+            pings (PingBatcher): optional, sends success pings instead of the outbound queue directly
+        """
+        self.success = success_msg
+        self.failed = failed_msg
+        self.scheduler = scheduler
+        self.outbound = outbound
+        self.tracker = tracker
+        self.get_channel = get_channel
+        self.materialize = materialize
+        self.pings = pings
+
 
 class ReactiveMessage:
     """
         Class to react and handle reactions after a delayed time
+
+        Only ids are kept around, discord objects get made from them
+        when something actually has to be sent or edited
     """
+    __slots__ = (
+        'template', 'msg_id', 'channel_id', 'guild_id', 'reaction',
+        'deadline', 'threshold', 'count', 'timer', 'passed', 'reconciled'
+    )
+
     def __init__(
             self,
             channel: discord.channel.TextChannel,
             msg,
             reaction: str,
-            success_msg: str,
-            failed_msg: str,
             delay: int,
             threshold: int,
+            template: EventTemplate,
             builder=False,
-            passed=False,
-            guilds=None
+            passed=False
         ):
         """
             Based on a posted message, it'll add a reaction and after a delayed time
             access reactions to that message
-            
+
             Args:
                 channel (discord.channel.TextChannel): text channel to msg in
-                msg (str): message string
+                msg (str): message string or embed
                 reaction (str): single-char emoji string
-                success_msg (str): message string for success
-                failed_msg (str): message string for failure
                 delay (int): integer in seconds
                 threshold (int): integer that represents how many users are need to be successful
-        """  
+                template (EventTemplate): texts and bot parts shared with other events
+
+            When built from serialization `msg` is the saved record (see `storage.EVENT_FIELDS`),
+            `delay` is ignored and nothing happens until `rehydrate` is called
+        """
+        self.template = template
+        self.reaction = reaction
+        self.deadline = time.time() + delay
+        self.timer = None
+        # live tally of self.reaction, kept up to date by the bot's raw reaction events
+        self.count = 0
+        self.reconciled = not builder
         if builder:
-            self.msg = None
-            self.success = success_msg
-            self.failed = failed_msg
-            self.channel = channel
-            self.reaction = reaction
-            self.delay = delay
-            self.raw_msg = msg
+            self.msg_id, self.guild_id, self.channel_id, self.deadline = msg[:4]
             self.threshold = threshold
             self.passed = passed
-            asyncio.get_event_loop().create_task(self.__start_from_builder(guilds))
+            if template.tracker is not None:
+                template.tracker.add(self)
         else:
-            self.msg = msg
-            self.success = success_msg
-            self.failed = failed_msg
-            self.channel = channel
-            self.reaction = reaction
-            self.delay = delay
-            self.raw_msg = None
+            self.msg_id = None
+            self.channel_id = channel.id
+            self.guild_id = channel.guild.id if getattr(channel, 'guild', None) else None
             self.threshold = threshold + 1
             self.passed = False
-            asyncio.get_event_loop().create_task(self.__access_after())
+            if template.tracker is not None:
+                template.tracker.add(self)
+            # the channel and prompt only live as long as it takes to post them
+            asyncio.get_event_loop().create_task(self.__access_after(channel, msg))
 
-        asyncio.get_event_loop().create_task(self.__check_message_reactions())
+    async def rehydrate(self, channel: discord.channel.TextChannel):
+        """
+        This fetches the message once after serialization to catch up on
+        reactions missed while offline, then starts the timer
+
+        Args:
+            channel (discord.channel.TextChannel): the channel the message was posted in
+        """
+        if self.timer:
+            # parked, the wake up isn't needed anymore
+            self.template.scheduler.cancel(self.timer)
+            self.timer = None
+        self.channel_id = channel.id
+        self.reconcile(await channel.fetch_message(self.msg_id))
+        await self.check_threshold()
+        if not self.passed:
+            self.__arm()
 
-    async def __start_from_builder(self, guilds: list):
+    def park(self, wake_at: float):
         """
-        This helps get the actuall message from id's handed off from storage
-        after serialization
+        Leaves a message built from serialization as ids only until `wake_at`,
+        then hands it to the template's `materialize`
+
+        Nothing gets fetched for it before then, unless someone reacts to it first
 
         Args:
-            guilds (list): list of guilds after 'on_ready' from the bot
+            wake_at (float): epoch time in seconds, EG: a while before the deadline
+        """
+        self.timer = self.template.scheduler.schedule(wake_at, self.__wake)
+
+    async def __wake(self):
+        self.timer = None
+        await self.template.materialize(self)
+
+    def get_channel_id(self) -> int:
+        return self.channel_id
+
+    def __arm(self):
         """
-        for guild in guilds:
-            if isinstance(guild, discord.Guild) and guild.id == self.raw_msg['guild_id']:
-                self.channel = guild.get_channel(self.raw_msg['channel_id'])
-                self.raw_msg = await self.channel.fetch_message(self.raw_msg['msg_id'])
-                break
-        await self.__wait_for_response()
+        Hands the deadline off to the scheduler
+        """
+        self.timer = self.template.scheduler.schedule(self.deadline, self.__wait_for_response)
 
     async def __wait_for_response(self):
         """
-        This is the normal waiting call for when a reactive message is made
+        This is the normal resolution for when a reactive message's time is up
         """
-        await self.__sleep_cycle()
-        msg = await self.channel.fetch_message(self.raw_msg.id)
+        self.timer = None
         if self.passed:
             return
-        for reaction in msg.reactions:
-            if reaction.emoji == self.reaction and reaction.count >= self.threshold:
-                await self.send_success_msg()
-                return
-        await self.send_failed_msg()
-    
-    async def __check_message_reactions(self):
-        """
-        This function become necessary after being built from serialization
-
-        This is because the 'on_reaction' no longer gets called if the bot is restarted
-        """
-        failed = True
-        while not self.passed:
-            if isinstance(self.raw_msg, discord.message.Message):
-                self.raw_msg = await self.channel.fetch_message(self.raw_msg.id)
-                for reaction in self.raw_msg.reactions:
-                    if reaction.emoji == self.reaction and reaction.count >= self.threshold:
-                        failed = False
-                        await self.send_success_msg()
-            await asyncio.sleep(5)
-        if failed:
+        if self.count >= self.threshold:
+            await self.send_success_msg()
+        else:
             await self.send_failed_msg()
 
-    async def __access_after(self):
+    def reconcile(self, msg: discord.message.Message):
+        """
+        Seeds the tally from a freshly fetched message
+
+        Reactions that happened while the bot was offline never show up as events,
+        so this is done once after being built from serialization
+
+        Args:
+            msg (discord.message.Message): the fetched message
+        """
+        self.count = 0
+        for reaction in msg.reactions:
+            if str(reaction.emoji) == self.reaction:
+                self.count = reaction.count
+        self.reconciled = True
+
+    def reaction_added(self):
+        """
+        Bumps the tally, ignored until the tally has been seeded
+        """
+        if self.reconciled:
+            self.count += 1
+
+    def reaction_removed(self):
+        """
+        Drops the tally, ignored until the tally has been seeded
+        """
+        if self.reconciled and self.count > 0:
+            self.count -= 1
+
+    def reactions_cleared(self):
+        """
+        Zeroes the tally after the reactions were cleared, ignored until the tally has been seeded
+        """
+        if self.reconciled:
+            self.count = 0
+
+    async def check_threshold(self) -> bool:
+        """
+        Pings if the tally has reached the threshold
+
+        Returns:
+            bool: True if the message passed
+        """
+        if not self.passed and self.count >= self.threshold:
+            await self.send_success_msg()
+            return True
+        return False
+
+    async def __access_after(self, channel: discord.channel.TextChannel, prompt):
         """
         This will create the message and have a timer running,
         if the threshold passed prior, no follow up will occur
         """
+        outbound = self.template.outbound
         msg = None
-        if isinstance(self.msg, discord.Embed):
-            msg = await self.channel.send(embed=self.msg)
-        else:
-            msg = await self.channel.send(self.msg)
-        self.raw_msg = msg
-        await msg.add_reaction(self.reaction)
-        await self.__wait_for_response()
+        try:
+            if isinstance(prompt, discord.Embed):
+                msg = await outbound.send(channel, PRIORITY_EVENT, embed=prompt)
+            else:
+                msg = await outbound.send(channel, PRIORITY_EVENT, content=prompt)
+        except Exception:
+            # EG: missing permissions in the channel, left like this it would never
+            # resolve but still count against the guild's open events
+            self.__complete()
+            return
+        self.msg_id = msg.id
+        if self.template.tracker is not None:
+            self.template.tracker.posted(self)
+        try:
+            await outbound.add_reaction(msg, self.reaction)
+        except Exception:
+            # the prompt is up, so it still runs, just without the bot's own reaction in the count
+            self.threshold -= 1
+        self.__arm()
+
+    def expire_now(self):
+        """
+        Pulls the deadline in to right now, must be called from the event loop
+        """
+        old_deadline, self.deadline = self.deadline, time.time()
+        if self.timer:
+            self.timer = self.template.scheduler.reschedule(self.timer, self.deadline)
+        if self.template.tracker is not None:
+            self.template.tracker.rescheduled(self, old_deadline)
+
+    def stop(self):
+        """
+        Drops the message without any follow up, must be called from the event loop
+        """
+        self.__complete()
 
-    async def __sleep_cycle(self):
+    def __complete(self):
         """
-        Helper funciton to sleep in 1 second intervals.
-        This way we can 'save' the state in which it
-        needs to continue sleeping
+        Marks the job as done, cancels its deadline (or parked wake up) and lets the tracker know
         """
-        while(self.delay > 0):
-            await asyncio.sleep(1)
-            self.delay -= 1
+        self.passed = True
+        if self.timer:
+            # otherwise the scheduler holds on to the message until the deadline
+            self.template.scheduler.cancel(self.timer)
+            self.timer = None
+        if self.template.tracker is not None:
+            self.template.tracker.completed(self)
 
     async def send_success_msg(self):
         """
         Sends a 'ping' message
         """
-        
+
         if not self.passed:
+            # completing first so a burst of reactions can't ping twice
+            self.__complete()
+            msg = self.get_msg()
+            if self.template.pings is not None:
+                await self.template.pings.ping(msg, self.template.success)
+                return
             mentions = discord.AllowedMentions(users=True, roles=True, replied_user=True)
-            await self.raw_msg.channel.send(
-                content=self.success,
+            await self.template.outbound.send(
+                msg.channel,
+                PRIORITY_PING,
+                content=self.template.success,
                 allowed_mentions=mentions,
-                reference=self.raw_msg.to_reference())
-            self.passed = True
-    
+                reference=msg.to_reference())
+
     async def send_failed_msg(self):
         """
         Edits message to indicate time has passed
         """
         if not self.passed:
-            self.passed = True
-            await self.raw_msg.edit(embed=None, content=self.failed)
+            self.__complete()
+            await self.template.outbound.edit(self.get_msg(), embed=None, content=self.template.failed)
 
     def is_complete(self) -> bool:
         """
@@ -165,80 +315,75 @@ class ReactiveMessage:
         """
         used to let the timer know after it wakes up to do nothing
         """
-        self.passed = True
+        self.__complete()
 
-    def to_dictionary(self) -> dict:
+    def to_record(self) -> tuple:
         """
         Helper function for serialization
-        
-        Basically JSON but not 
 
         Instead of serializing the whole async and etc
 
         Serialize what we need to create a new object w/ 'equal' status
 
         Returns:
-            dict: representation of this class
-        """
-        dictionary = {}
-        if not self.raw_msg:
-            # message hasn't posted yet
-            return {}
-        dictionary['msg_id'] = self.raw_msg.id
-        dictionary['channel_id'] = self.raw_msg.channel.id
-        dictionary['guild_id'] = self.raw_msg.guild.id
-        dictionary['reaction'] = self.reaction
-        dictionary['success'] = self.success
-        dictionary['failed'] = self.failed
-        dictionary['delay'] = self.delay
-        dictionary['offline_since'] = datetime.now(tz=pytz.timezone(BOT_TIME_ZONE)).strftime(STRFTIME_FORMAT)
-        dictionary['threshold'] = self.threshold
-        dictionary['passed'] = self.passed
-        return dictionary
-
-    def get_delay_remaining(self) -> str:
-        return self.delay
+            tuple: fields in `storage.EVENT_FIELDS` order, None if the message hasn't posted yet
+        """
+        if self.msg_id is None:
+            return None
+        return (
+            self.msg_id,
+            self.guild_id,
+            self.channel_id,
+            self.deadline,
+            self.threshold,
+            self.passed,
+            self.reaction,
+            self.template.success,
+            self.template.failed
+        )
+
+    def get_delay_remaining(self) -> int:
+        return max(0, int(self.deadline - time.time()))
 
     def get_reaction(self) -> str:
         return self.reaction
 
     def get_failed_msg(self) -> str:
-        return self.failed
+        return self.template.failed
 
     def get_success_msg(self) -> str:
-        return self.success
+        return self.template.success
 
     def get_threshold(self) -> int:
-        return self.threshold   
+        return self.threshold
+
+    def get_msg(self) -> discord.PartialMessage:
+        """
+        Makes a message object from the ids, without fetching anything
 
-    def get_msg(self) -> discord.message.Message:
-        return self.raw_msg
+        Returns:
+            discord.PartialMessage: enough of a message to reply to, edit or react to
+        """
+        channel = self.template.get_channel(self.channel_id)
+        if channel is None:
+            raise ChannelGone("channel " + str(self.channel_id) + " is gone")
+        return channel.get_partial_message(self.msg_id)
 
-def reactive_message_builder(ref: dict, guilds: list) -> ReactiveMessage:
+def reactive_message_builder(record: tuple, template: EventTemplate) -> ReactiveMessage:
     """
     This is used for building ReactiveMessage after serialization
 
     Args:
-        ref (ReactiveMessage): Must be of reactive message type
+        record (tuple): saved message, see `ReactiveMessage.to_record`
+        template (EventTemplate): template with this message's success/failure texts
     """
-    delta = (
-        datetime.now() -
-        datetime.strptime(ref['offline_since'], STRFTIME_FORMAT)
-    )
-    
-    msg = {}
-    msg['msg_id'] = ref['msg_id']
-    msg['channel_id'] = ref['channel_id']
-    msg['guild_id'] = ref['guild_id']
     return ReactiveMessage(
         channel=None,
-        msg=msg,
-        reaction=ref['reaction'],
-        success_msg=ref['success'],
-        failed_msg=ref['failed'],
-        delay=ref['delay'] - delta.total_seconds(),
-        threshold=ref['threshold'],
+        msg=record,
+        reaction=record[6],
+        delay=0,
+        threshold=record[4],
+        template=template,
         builder=True,
-        passed=ref['passed'],
-        guilds=guilds
-    )
\ No newline at end of file
+        passed=bool(record[5])
+    )
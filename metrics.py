@@ -0,0 +1,244 @@
+import asyncio
+import bisect
+from threading import Lock
+
+# seconds, covers a dictionary lookup up to a slow discord call
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names: tuple, values: tuple, extra: str = None) -> str:
+    """
+    Helper that turns label names and values into `{a="1",b="2"}`
+    """
+    pairs = [name + '="' + escape(value) + '"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(pairs) + '}'
+
+
+class Counter:
+    """
+    Only goes up, one value per combination of labels
+    """
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self.__lock = Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        """
+        Args:
+            labels: one value per label name, in order
+            amount (float): how much to add
+        """
+        with self.__lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get(self, *labels) -> float:
+        return self.values.get(labels, 0)
+
+    def samples(self) -> list:
+        return [(self.name, self.labels, labels, value, None) for labels, value in sorted(self.values.items())]
+
+    def summary(self) -> list:
+        return [self.name + format_labels(self.labels, labels) + ' ' + str(value) for labels, value in sorted(self.values.items())]
+
+
+class Gauge:
+    """
+    A value that goes up and down, either set directly or read from a function when collected
+    """
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, func=None):
+        self.name = name
+        self.help = help
+        self.labels = ()
+        self.value = 0
+        self.func = func
+
+    def set(self, value: float):
+        self.value = value
+
+    def get(self) -> float:
+        if self.func:
+            return self.func()
+        return self.value
+
+    def samples(self) -> list:
+        return [(self.name, (), (), self.get(), None)]
+
+    def summary(self) -> list:
+        return [self.name + ' ' + str(self.get())]
+
+
+class Histogram:
+    """
+    Counts observations into buckets, one set of buckets per combination of labels
+    """
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [count per bucket (+Inf last), sum, count]
+        self.values = {}
+        self.__lock = Lock()
+
+    def observe(self, value: float, *labels):
+        """
+        Args:
+            value (float): what was measured, EG: seconds taken
+            labels: one value per label name, in order
+        """
+        i = bisect.bisect_left(self.buckets, value)
+        with self.__lock:
+            entry = self.values.get(labels)
+            if entry is None:
+                entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def count(self, *labels) -> int:
+        entry = self.values.get(labels)
+        return entry[2] if entry else 0
+
+    def quantile(self, q: float, *labels) -> float:
+        """
+        Rough quantile, the upper bound of the bucket it falls in
+
+        Returns:
+            float: None without any observations, inf if it's past the last bucket
+        """
+        entry = self.values.get(labels)
+        if not entry or not entry[2]:
+            return None
+        target = q * entry[2]
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), entry[0]):
+            seen += count
+            if seen >= target:
+                return bound
+        return float('inf')
+
+    def samples(self) -> list:
+        samples = []
+        for labels, (counts, total, count) in sorted(self.values.items()):
+            seen = 0
+            for bound, bucket in zip(self.buckets + ('+Inf',), counts):
+                seen += bucket
+                samples.append((self.name + '_bucket', self.labels, labels, seen, 'le="' + str(bound) + '"'))
+            samples.append((self.name + '_sum', self.labels, labels, total, None))
+            samples.append((self.name + '_count', self.labels, labels, count, None))
+        return samples
+
+    def summary(self) -> list:
+        lines = []
+        for labels, (_, total, count) in sorted(self.values.items()):
+            lines.append(
+                self.name + format_labels(self.labels, labels) +
+                ' count=' + str(count) +
+                ' mean=' + str(round(total / count * 1000, 3)) + 'ms' +
+                ' p50<=' + str(self.quantile(0.5, *labels)) + 's' +
+                ' p99<=' + str(self.quantile(0.99, *labels)) + 's'
+            )
+        return lines
+
+
+class Metrics:
+    """
+    Holds every counter, gauge and histogram the bot keeps
+
+    Everything here is cheap enough to record on every command and API call,
+    reading it back is left for `summary`/`exposition` when someone asks
+    """
+
+    def __init__(self):
+        self.metrics = {}
+
+    def __add(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> Counter:
+        return self.__add(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, func=None) -> Gauge:
+        return self.__add(Gauge(name, help, func))
+
+    def histogram(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self.__add(Histogram(name, help, labels, buckets))
+
+    def get(self, name: str):
+        return self.metrics.get(name)
+
+    def summary(self) -> str:
+        """
+        Returns:
+            str: one line per value, for reading in a terminal
+        """
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.summary())
+        return '\n'.join(lines)
+
+    def exposition(self) -> str:
+        """
+        Returns:
+            str: every metric in the Prometheus text format
+        """
+        lines = []
+        for metric in self.metrics.values():
+            lines.append('# HELP ' + metric.name + ' ' + escape(metric.help))
+            lines.append('# TYPE ' + metric.name + ' ' + metric.kind)
+            for name, label_names, labels, value, extra in metric.samples():
+                lines.append(name + format_labels(label_names, labels, extra) + ' ' + str(value))
+        return '\n'.join(lines) + '\n'
+
+
+async def serve(metrics: Metrics, host: str, port: int) -> asyncio.AbstractServer:
+    """
+    Starts a tiny HTTP server on the event loop that answers every request with `metrics.exposition()`
+
+    Args:
+        metrics (Metrics): what to serve
+        host (str): interface to listen on, keep this local
+        port (int): port to listen on
+
+    Returns:
+        asyncio.AbstractServer: the running server
+    """
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            # the request itself doesn't matter, just read up to the end of the headers
+            while True:
+                line = await reader.readline()
+                if not line or line in (b'\r\n', b'\n'):
+                    break
+            body = metrics.exposition().encode()
+            writer.write(
+                b'HTTP/1.1 200 OK\r\n'
+                b'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+                b'Content-Length: ' + str(len(body)).encode() + b'\r\n'
+                b'Connection: close\r\n\r\n' + body
+            )
+            await writer.drain()
+        except Exception:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
@@ -0,0 +1,161 @@
+import asyncio
+import heapq
+import itertools
+import time
+from ratelimit import TokenBucket, KeyedLimiter
+
+# lower goes first
+PRIORITY_PING = 0
+PRIORITY_EVENT = 1
+PRIORITY_REPLY = 2
+PRIORITY_HELP = 3
+
+# Discord's documented limits: 5 messages per 5 seconds per channel and 50 requests a second overall
+CHANNEL_LIMIT = (5, 5.0)
+GLOBAL_LIMIT = (50, 1.0)
+
+
+class OutboundQueue:
+    """
+    Every send, edit and reaction the bot makes goes through here
+
+    Each channel gets its own lane with a priority heap and a token bucket,
+    so a burst in one channel only slows that channel down and pings go out
+    ahead of less important text. A pending edit to a message gets replaced
+    by a newer edit to the same message instead of both being sent
+    """
+
+    def __init__(self, channel_limit=CHANNEL_LIMIT, global_limit=GLOBAL_LIMIT, metrics=None, max_buckets: int = 1000):
+        """
+        Args:
+            channel_limit (tuple): (requests, seconds) allowed per channel
+            global_limit (tuple): (requests, seconds) allowed across every channel
+            metrics (Metrics): optional, records how long each call takes per route
+            max_buckets (int): channel buckets kept before the ones that have filled back up get dropped
+        """
+        self.channel_limit = channel_limit
+        self.__call_time = None
+        self.__call_errors = None
+        if metrics is not None:
+            self.__call_time = metrics.histogram(
+                'playbot_outbound_seconds', "Time taken by discord API calls", ('route',))
+            self.__call_errors = metrics.counter(
+                'playbot_outbound_errors_total', "Discord API calls that raised", ('route',))
+        self.__global = TokenBucket(*global_limit)
+        self.__counter = itertools.count()
+        self.__lanes = {}
+        # channel id -> TokenBucket
+        self.__buckets = KeyedLimiter(*channel_limit, max_keys=max_buckets)
+        self.__workers = {}
+        # message id -> queued edit that hasn't gone out yet
+        self.__edits = {}
+
+    def send(self, channel, priority: int = PRIORITY_REPLY, **kwargs) -> asyncio.Future:
+        """
+        Queues `channel.send(**kwargs)`
+
+        Args:
+            channel (discord.abc.Messageable): where to send
+            priority (int): one of the PRIORITY_ constants
+
+        Returns:
+            asyncio.Future: resolves to the sent discord.Message
+        """
+        return self.__submit(channel.id, priority, channel.send, (), kwargs)[5]
+
+    def edit(self, message, priority: int = PRIORITY_EVENT, **kwargs) -> asyncio.Future:
+        """
+        Queues `message.edit(**kwargs)`, replacing an older edit of the same message
+        that hasn't been sent yet
+
+        Args:
+            message (discord.Message): message to edit
+            priority (int): one of the PRIORITY_ constants
+
+        Returns:
+            asyncio.Future: resolves once the edit is done
+        """
+        entry = self.__edits.get(message.id)
+        if entry:
+            entry[4] = kwargs
+            if priority < entry[0]:
+                entry[0] = priority
+                heapq.heapify(self.__lanes[message.channel.id])
+            return entry[5]
+        entry = self.__submit(message.channel.id, priority, message.edit, (), kwargs, message.id)
+        self.__edits[message.id] = entry
+        return entry[5]
+
+    def add_reaction(self, message, emoji: str, priority: int = PRIORITY_EVENT) -> asyncio.Future:
+        """
+        Queues `message.add_reaction(emoji)`
+
+        Args:
+            message (discord.Message): message to react to
+            emoji (str): emoji to react with
+            priority (int): one of the PRIORITY_ constants
+
+        Returns:
+            asyncio.Future: resolves once the reaction is added
+        """
+        return self.__submit(message.channel.id, priority, message.add_reaction, (emoji,), {})[5]
+
+    def budgets(self) -> dict:
+        """
+        Returns:
+            dict: channel id -> requests that can go out right now, plus 'global'
+        """
+        budgets = {channel_id: bucket.remaining() for channel_id, bucket in self.__buckets.items()}
+        budgets['global'] = self.__global.remaining()
+        return budgets
+
+    def __len__(self) -> int:
+        return sum(len(lane) for lane in self.__lanes.values())
+
+    def __submit(self, channel_id: int, priority: int, func, args: tuple, kwargs: dict, edit_of: int = None) -> list:
+        """
+        Helper that pushes a call onto a channel's lane, starting the lane if needed
+
+        Returns:
+            list: the queue entry, [priority, order, func, args, kwargs, future, edited message id]
+        """
+        loop = asyncio.get_event_loop()
+        entry = [priority, next(self.__counter), func, args, kwargs, loop.create_future(), edit_of]
+        heapq.heappush(self.__lanes.setdefault(channel_id, []), entry)
+        if channel_id not in self.__workers:
+            self.__workers[channel_id] = loop.create_task(self.__drain(channel_id))
+        return entry
+
+    async def __drain(self, channel_id: int):
+        """
+        Works through a channel's lane and goes away once it's empty
+        """
+        lane = self.__lanes[channel_id]
+        # only full buckets ever get dropped, so holding on to it here is safe
+        bucket = self.__buckets.bucket(channel_id)
+        try:
+            while lane:
+                await bucket.take()
+                await self.__global.take()
+                _, _, func, args, kwargs, future, edit_of = heapq.heappop(lane)
+                if edit_of is not None:
+                    # from here on a new edit of this message has to be queued separately
+                    self.__edits.pop(edit_of, None)
+                if future.cancelled():
+                    continue
+                start = time.perf_counter()
+                try:
+                    result = await func(*args, **kwargs)
+                    if not future.done():
+                        future.set_result(result)
+                except Exception as e:
+                    if self.__call_errors is not None:
+                        self.__call_errors.inc(func.__name__)
+                    if not future.done():
+                        future.set_exception(e)
+                if self.__call_time is not None:
+                    self.__call_time.observe(time.perf_counter() - start, func.__name__)
+        finally:
+            del self.__workers[channel_id]
+            if not lane:
+                del self.__lanes[channel_id]
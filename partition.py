@@ -0,0 +1,91 @@
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+from scheduler import Scheduler
+from tracking import EventTracker
+
+
+class Partition:
+    """
+    The slice of the bot's state that belongs to one shard
+
+    Every shard gets its own scheduler, running messages, event templates,
+    dirty flags and save file, so a busy shard's timers, tallies and saves
+    never have to wait on another shard's
+    """
+
+    def __init__(self, shard_id: int, store):
+        """
+        Args:
+            shard_id (int): shard these guilds are on, 0 when not sharded
+            store (PickleStore/SQLiteStore): where this partition gets saved
+        """
+        self.shard_id = shard_id
+        self.store = store
+        self.scheduler = Scheduler()
+        self.running_msgs = EventTracker(on_change=self.mark_msg_dirty)
+        # (success, failed) -> EventTemplate shared by every event with those texts
+        self.templates = {}
+        # rule id -> RecurringRule
+        self.rules = {}
+        # bot-wide settings, every partition's file carries a copy
+        self.dirty = False
+        self.dirty_msgs = set()
+        self.dirty_guilds = set()
+        self.dirty_rules = set()
+        # one worker so this partition's saves hit the disk in the order they were taken
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def mark_msg_dirty(self, msg_id: int):
+        self.dirty_msgs.add(msg_id)
+
+    def is_dirty(self) -> bool:
+        return self.dirty or bool(self.dirty_msgs) or bool(self.dirty_guilds) or bool(self.dirty_rules)
+
+    def reset(self):
+        """
+        Drops every running message and recurring event, EG: before loading the save files
+        """
+        self.running_msgs = EventTracker(on_change=self.mark_msg_dirty)
+        # templates point at the tracker, so they start over with it
+        self.templates = {}
+        for rule in self.rules.values():
+            if rule.timer:
+                self.scheduler.cancel(rule.timer)
+        self.rules = {}
+
+
+class PartitionedEvents:
+    """
+    Read-only view of every partition's running messages as if they were one tracker
+    """
+
+    def __init__(self, partitions: dict):
+        """
+        Args:
+            partitions (dict): shard id -> Partition, read live
+        """
+        self.__partitions = partitions
+
+    def get(self, msg_id: int):
+        for partition in list(self.__partitions.values()):
+            rmsg = partition.running_msgs.get(msg_id)
+            if rmsg is not None:
+                return rmsg
+        return None
+
+    def select(self, selector) -> list:
+        """
+        Every partition's `EventTracker.select`, merged back into deadline order
+        """
+        return list(heapq.merge(
+            *[partition.running_msgs.select(selector) for partition in list(self.__partitions.values())],
+            key=lambda rmsg: rmsg.deadline))
+
+    def __iter__(self):
+        return iter([rmsg for partition in list(self.__partitions.values()) for rmsg in partition.running_msgs])
+
+    def __len__(self) -> int:
+        return sum(len(partition.running_msgs) for partition in list(self.__partitions.values()))
+
+    def __contains__(self, msg_id: int) -> bool:
+        return self.get(msg_id) is not None
@@ -0,0 +1,120 @@
+import asyncio
+import discord
+from outbound import OutboundQueue, PRIORITY_PING
+
+# discord won't take a message longer than this
+MESSAGE_LIMIT = 2000
+MENTIONS = discord.AllowedMentions(users=True, roles=True, replied_user=True)
+
+
+class PingBatcher:
+    """
+    Sends the success pings of events, optionally merging the ones that land
+    in the same channel within `window` seconds into one message
+
+    A merged message replies to the first event and links every other one,
+    each success text (and so each role) only shows up once. With a window
+    of 0 every event gets its own reply, same as without a batcher
+    """
+
+    def __init__(self, outbound: OutboundQueue, window: float = 0, metrics=None):
+        """
+        Args:
+            outbound (OutboundQueue): the bot's queue for anything sent to discord
+            window (float): seconds to hold a ping waiting for others in the channel, 0 for off
+            metrics (Metrics): optional, counts the messages merging saved
+        """
+        self.outbound = outbound
+        self.window = window
+        # channel id -> [(message, success text, future)] waiting to go out
+        self.__pending = {}
+        self.__saved = None
+        if metrics is not None:
+            self.__saved = metrics.counter(
+                'playbot_pings_merged_total', "Success pings that went out in another event's message")
+
+    def ping(self, msg: discord.PartialMessage, text: str) -> asyncio.Future:
+        """
+        Queues a success ping replying to an event's message
+
+        Args:
+            msg (discord.PartialMessage): the event's message
+            text (str): the success text, mentions and all
+
+        Returns:
+            asyncio.Future: resolves to the sent discord.Message, shared by everything it was merged with
+        """
+        if self.window <= 0:
+            return self.outbound.send(msg.channel, PRIORITY_PING, content=text, allowed_mentions=MENTIONS, reference=msg.to_reference())
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        batch = self.__pending.get(msg.channel.id)
+        if batch is None:
+            batch = self.__pending[msg.channel.id] = []
+            loop.call_later(self.window, self.__flush, msg.channel)
+        batch.append((msg, text, future))
+        return future
+
+    def __len__(self) -> int:
+        return sum(len(batch) for batch in self.__pending.values())
+
+    def __flush(self, channel):
+        """
+        Hands a channel's batch to the outbound queue
+        """
+        batch = self.__pending.pop(channel.id)
+        contents = compose(batch[0][0], [(msg, text) for msg, text, _ in batch])
+        sends = [
+            self.outbound.send(
+                channel,
+                PRIORITY_PING,
+                content=content,
+                allowed_mentions=MENTIONS,
+                # only the first message can be a reply, the rest are the links that didn't fit
+                reference=batch[0][0].to_reference() if i == 0 else None)
+            for i, content in enumerate(contents)
+        ]
+        if self.__saved is not None:
+            self.__saved.inc(amount=len(batch) - len(sends))
+        asyncio.gather(*sends).add_done_callback(lambda done: self.__resolve(batch, done))
+
+    def __resolve(self, batch: list, done: asyncio.Future):
+        for _, _, future in batch:
+            if future.done():
+                continue
+            if done.cancelled():
+                future.cancel()
+            elif done.exception() is not None:
+                future.set_exception(done.exception())
+            else:
+                future.set_result(done.result()[0])
+
+
+def compose(reference: discord.PartialMessage, pings: list) -> list:
+    """
+    Lays out a batch of pings, one line per success text followed by links to its events
+
+    Args:
+        reference (discord.PartialMessage): the event being replied to, it doesn't need a link
+        pings (list): (event message, success text) pairs in the order they came in
+
+    Returns:
+        list: message contents, more than one only if it doesn't fit in MESSAGE_LIMIT
+    """
+    # text -> links, dictionaries keep the order the texts first came in
+    lines = {}
+    for msg, text in pings:
+        links = lines.setdefault(text, [])
+        if msg is not reference:
+            links.append(msg.jump_url)
+    contents = []
+    content = ""
+    for text, links in lines.items():
+        for i, word in enumerate([text] + links):
+            separator = "\n" if i == 0 else " "
+            if content and len(content) + len(separator) + len(word) > MESSAGE_LIMIT:
+                contents.append(content)
+                content = ""
+            content = content + separator + word if content else word
+    contents.append(content)
+    return contents
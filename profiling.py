@@ -0,0 +1,136 @@
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import tracemalloc
+from datetime import datetime
+
+# how many frames tracemalloc keeps per allocation
+TRACE_DEPTH = 25
+
+
+class Profiler:
+    """
+    On-demand cProfile, tracemalloc and task dumps for a running bot
+
+    Nothing is hooked into the interpreter until a profile or trace is started,
+    so this costs nothing while it's off. Everything gets written into `out_dir`
+    to be looked at offline, EG: `python -m pstats profiles/profile-....prof`
+    """
+
+    def __init__(self, out_dir: str = "./profiles"):
+        self.out_dir = out_dir
+        self.__profile = None
+        self.__snapshot = None
+
+    def __path(self, kind: str, ext: str) -> str:
+        """
+        Helper that makes a timestamped file name in `out_dir`
+        """
+        os.makedirs(self.out_dir, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        return os.path.join(self.out_dir, kind + "-" + stamp + "." + ext)
+
+    def is_profiling(self) -> bool:
+        return self.__profile is not None
+
+    def start_profile(self):
+        """
+        Starts profiling the calling thread, call this on the event loop's thread
+        """
+        if self.__profile:
+            raise RuntimeError("already profiling")
+        self.__profile = cProfile.Profile()
+        self.__profile.enable()
+
+    def stop_profile(self, top: int = 20) -> tuple:
+        """
+        Stops profiling and writes the stats, call this on the same thread as `start_profile`
+
+        Args:
+            top (int): how many of the most expensive functions to summarize
+
+        Returns:
+            tuple: (path of the .prof file, summary text sorted by cumulative time)
+        """
+        if not self.__profile:
+            raise RuntimeError("not profiling")
+        profile, self.__profile = self.__profile, None
+        profile.disable()
+        path = self.__path("profile", "prof")
+        profile.dump_stats(path)
+        summary = io.StringIO()
+        pstats.Stats(profile, stream=summary).sort_stats('cumulative').print_stats(top)
+        return path, summary.getvalue()
+
+    def take_snapshot(self, top: int = 10) -> tuple:
+        """
+        Takes a tracemalloc snapshot, starting tracing first if it isn't on
+
+        The first snapshot after starting only marks a baseline,
+        every one after that is compared to the one before it
+
+        Args:
+            top (int): how many of the biggest changes to summarize
+
+        Returns:
+            tuple: (path of the snapshot, summary text of what grew since the last one)
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACE_DEPTH)
+            self.__snapshot = None
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        path = self.__path("memory", "snap")
+        snapshot.dump(path)
+        current, peak = tracemalloc.get_traced_memory()
+        lines = ["traced: " + str(current) + " bytes, peak: " + str(peak) + " bytes"]
+        if self.__snapshot is None:
+            lines.append("baseline taken, take another snapshot to compare")
+        else:
+            stats = snapshot.compare_to(self.__snapshot, 'lineno')
+            lines.extend(str(stat) for stat in stats[:top])
+            diff = self.__path("memory-diff", "txt")
+            with open(diff, 'w') as f:
+                f.write('\n'.join(str(stat) for stat in stats))
+            lines.append("full diff: " + diff)
+        self.__snapshot = snapshot
+        return path, '\n'.join(lines)
+
+    def stop_tracing(self):
+        """
+        Stops tracemalloc and forgets the last snapshot
+        """
+        self.__snapshot = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def dump_tasks(self, loop: asyncio.AbstractEventLoop = None) -> tuple:
+        """
+        Writes the stack of every task on the loop, call this on the event loop's thread
+
+        Tasks running a ReactiveMessage coroutine are listed first
+
+        Returns:
+            tuple: (path of the dump, one line per task)
+        """
+        tasks = list(asyncio.all_tasks(loop))
+        tasks.sort(key=lambda task: not self.__is_event_task(task))
+        path = self.__path("tasks", "txt")
+        lines = []
+        with open(path, 'w') as f:
+            for task in tasks:
+                name = task.get_coro().__qualname__ if task.get_coro() else repr(task)
+                lines.append(task.get_name() + " " + name)
+                f.write("=== " + task.get_name() + " " + name + "\n")
+                task.print_stack(file=f)
+                f.write("\n")
+        lines.append(str(len(tasks)) + " tasks, stacks in " + path)
+        return path, '\n'.join(lines)
+
+    def __is_event_task(self, task: asyncio.Task) -> bool:
+        coro = task.get_coro()
+        return bool(coro) and coro.__qualname__.startswith("ReactiveMessage.")
@@ -0,0 +1,123 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Classic token bucket, `capacity` tokens refilled evenly over `period` seconds
+    """
+
+    def __init__(self, capacity: int, period: float):
+        """
+        Args:
+            capacity (int): most tokens the bucket can hold (the burst size)
+            period (float): seconds it takes to refill a full bucket
+        """
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = float(capacity)
+        self.last = time.monotonic()
+
+    def __refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def try_take(self) -> bool:
+        """
+        Takes a token if there is one
+
+        Returns:
+            bool: True if a token was taken
+        """
+        self.__refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def delay(self) -> float:
+        """
+        Returns:
+            float: seconds until the next token is available
+        """
+        self.__refill()
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def remaining(self) -> int:
+        """
+        Returns:
+            int: whole tokens left right now
+        """
+        self.__refill()
+        return int(self.tokens)
+
+    async def take(self):
+        """
+        Waits until a token is available and takes it
+        """
+        while not self.try_take():
+            await asyncio.sleep(self.delay())
+
+
+class KeyedLimiter:
+    """
+    A token bucket per key (EG: per user id), made the first time the key shows up
+
+    A bucket that has filled back up is no different from a new one, so those
+    get dropped whenever there are more than `max_keys` buckets around
+    """
+
+    def __init__(self, capacity: int, period: float, max_keys: int = 10000):
+        """
+        Args:
+            capacity (int): most tokens each bucket can hold (the burst size)
+            period (float): seconds it takes to refill a full bucket
+            max_keys (int): how many buckets to keep before dropping full ones
+        """
+        self.capacity = capacity
+        self.period = period
+        self.max_keys = max_keys
+        self.__buckets = {}
+        self.__prune_at = max_keys
+
+    def bucket(self, key) -> TokenBucket:
+        """
+        Args:
+            key: what's being limited, EG: a user id
+
+        Returns:
+            TokenBucket: the key's bucket
+        """
+        bucket = self.__buckets.get(key)
+        if bucket is None:
+            if len(self.__buckets) >= self.__prune_at:
+                self.prune()
+            bucket = self.__buckets[key] = TokenBucket(self.capacity, self.period)
+        return bucket
+
+    def prune(self) -> int:
+        """
+        Drops every bucket that has filled back up
+
+        Returns:
+            int: how many were dropped
+        """
+        full = [key for key, bucket in self.__buckets.items() if bucket.remaining() >= self.capacity]
+        for key in full:
+            del self.__buckets[key]
+        # if everything is busy, wait until there's twice as many before looking again
+        self.__prune_at = max(self.max_keys, 2 * len(self.__buckets))
+        return len(full)
+
+    def items(self) -> list:
+        """
+        Returns:
+            list: (key, TokenBucket) for every bucket that's around
+        """
+        return list(self.__buckets.items())
+
+    def __len__(self) -> int:
+        return len(self.__buckets)
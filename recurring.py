@@ -0,0 +1,215 @@
+import time
+from datetime import datetime, timedelta
+from render import get_timezone
+
+DAY_NAMES = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+# bit i set means weekday i (monday is 0), like `datetime.weekday`
+EVERY_DAY = 0b1111111
+WEEKDAYS = 0b0011111
+WEEKEND = 0b1100000
+
+
+class Recurrence:
+    """
+    What `every` was asked for, before it belongs to a guild and channel
+    """
+
+    def __init__(self, weekdays: int = 0, every_days: int = 0, hour: int = None, minute: int = None):
+        """
+        Args:
+            weekdays (int): bit mask of days of the week, 0 when going by `every_days`
+            every_days (int): days between events, 0 when going by `weekdays`
+            hour (int): hour of the day, None for the time it was asked at
+            minute (int): minute of the hour
+        """
+        self.weekdays = weekdays
+        self.every_days = every_days
+        self.hour = hour
+        self.minute = minute
+
+
+def recurrence(arg: str) -> Recurrence:
+    """
+    Converter for recurring schedules, EG: 'weekday at 19:00', '2 days', 'monday,friday at 20:30'
+
+    Days are 'day', '<n> days', 'weekday', 'weekend' or day names, and the
+    time is 24 hour 'h:m' after 'at'
+
+    Args:
+        arg (str): everything after `every`
+
+    Returns:
+        Recurrence: what was asked for
+    """
+    words = arg.lower().replace(',', ' ').split()
+    spec = Recurrence()
+    if 'at' in words:
+        i = words.index('at')
+        if i != len(words) - 2:
+            raise ValueError("'at' has to come last")
+        spec.hour, spec.minute = [int(part) for part in words[i + 1].split(':')]
+        if not (0 <= spec.hour < 24 and 0 <= spec.minute < 60):
+            raise ValueError("no such time")
+        words = words[:i]
+    if not words:
+        raise ValueError("which days?")
+    if words[0].isdigit() and len(words) == 2 and words[1] in ('day', 'days'):
+        spec.every_days = int(words[0])
+        if spec.every_days < 1:
+            raise ValueError("at least every day")
+    elif words in (['day'], ['days']):
+        spec.every_days = 1
+    elif words in (['weekday'], ['weekdays']):
+        spec.weekdays = WEEKDAYS
+    elif words in (['weekend'], ['weekends']):
+        spec.weekdays = WEEKEND
+    else:
+        for word in words:
+            word = word.rstrip('s')
+            # 'mon', 'monday' and 'mondays' all work
+            day = next((i for i, name in enumerate(DAY_NAMES) if len(word) >= 3 and name.startswith(word)), None)
+            if day is None:
+                raise ValueError("unknown day " + word)
+            spec.weekdays |= 1 << day
+    return spec
+
+
+class RecurringRule:
+    """
+    An event that repeats, only its next occurrence ever gets posted
+
+    The rule is all that's kept around and saved, the bot turns the next
+    occurrence into a ReactiveMessage once it gets close and then works out
+    the one after that
+    """
+    __slots__ = ('rule_id', 'guild_id', 'channel_id', 'weekdays', 'every_days', 'hour', 'minute', 'zone', 'next_at', 'timer')
+
+    def __init__(
+            self,
+            rule_id: int,
+            guild_id: int,
+            channel_id: int,
+            weekdays: int,
+            every_days: int,
+            hour: int,
+            minute: int,
+            zone: str,
+            next_at: float
+        ):
+        """
+        Args:
+            rule_id (int): id of the message that asked for it
+            guild_id (int): guild the events are for
+            channel_id (int): channel the events get posted in
+            weekdays (int): bit mask of days of the week, 0 when going by `every_days`
+            every_days (int): days between events, 0 when going by `weekdays`
+            hour (int): hour of the day in `zone`
+            minute (int): minute of the hour
+            zone (str): timezone name the time of day is in, EG: 'America/Los_Angeles'
+            next_at (float): epoch time in seconds of the next occurrence
+        """
+        self.rule_id = rule_id
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.weekdays = weekdays
+        self.every_days = every_days
+        self.hour = hour
+        self.minute = minute
+        self.zone = zone
+        self.next_at = next_at
+        self.timer = None
+
+    def next_after(self, after: float) -> float:
+        """
+        Works out the first occurrence after a time, in local time so DST doesn't shift it
+
+        Args:
+            after (float): epoch time in seconds
+
+        Returns:
+            float: epoch time in seconds of the occurrence
+        """
+        tz = get_timezone(self.zone)
+        if self.every_days and self.next_at is not None:
+            # counted from the last occurrence, not from whenever this got asked
+            day, step = datetime.fromtimestamp(self.next_at, tz).date(), self.every_days
+        else:
+            day, step = datetime.fromtimestamp(after, tz).date(), 1
+        while True:
+            if not self.weekdays or self.weekdays >> day.weekday() & 1:
+                at = tz.localize(datetime(day.year, day.month, day.day, self.hour, self.minute)).timestamp()
+                if at > after:
+                    return at
+            day += timedelta(days=step)
+
+    def describe(self) -> str:
+        """
+        Returns:
+            str: EG: 'every weekday at 19:00 (America/Los_Angeles)'
+        """
+        if self.every_days:
+            days = "every day" if self.every_days == 1 else "every " + str(self.every_days) + " days"
+        elif self.weekdays == EVERY_DAY:
+            days = "every day"
+        elif self.weekdays == WEEKDAYS:
+            days = "every weekday"
+        elif self.weekdays == WEEKEND:
+            days = "every weekend"
+        else:
+            days = "every " + ", ".join(name.capitalize() for i, name in enumerate(DAY_NAMES) if self.weekdays >> i & 1)
+        return days + " at " + str(self.hour) + ":" + str(self.minute).zfill(2) + " (" + self.zone + ")"
+
+    def to_record(self) -> tuple:
+        """
+        Helper function for serialization
+
+        Returns:
+            tuple: fields in `storage.RULE_FIELDS` order
+        """
+        return (
+            self.rule_id,
+            self.guild_id,
+            self.channel_id,
+            self.weekdays,
+            self.every_days,
+            self.hour,
+            self.minute,
+            self.zone,
+            self.next_at
+        )
+
+
+def new_rule(rule_id: int, guild_id: int, channel_id: int, spec: Recurrence, zone: str) -> RecurringRule:
+    """
+    Makes a rule out of what `every` was asked for, with its first occurrence worked out
+
+    Args:
+        rule_id (int): id of the message that asked for it
+        guild_id (int): guild the events are for
+        channel_id (int): channel the events get posted in
+        spec (Recurrence): days and time of day
+        zone (str): timezone name the time of day is in
+    """
+    now = time.time()
+    after = now
+    hour, minute = spec.hour, spec.minute
+    if hour is None:
+        # no time given, so the same time of day as right now
+        local = datetime.fromtimestamp(now, get_timezone(zone))
+        hour, minute = local.hour, local.minute
+        if spec.every_days:
+            # EG: 'every 2 days' starts 2 days from now, not tomorrow
+            after = now + (spec.every_days - 1) * 24 * 60 * 60
+    rule = RecurringRule(rule_id, guild_id, channel_id, spec.weekdays, spec.every_days, hour, minute, zone, None)
+    rule.next_at = rule.next_after(after)
+    return rule
+
+
+def recurring_rule_builder(record: tuple) -> RecurringRule:
+    """
+    This is used for building RecurringRule after serialization
+
+    Args:
+        record (tuple): saved rule, see `RecurringRule.to_record`
+    """
+    return RecurringRule(*record)
@@ -0,0 +1,119 @@
+import re
+from datetime import datetime
+from functools import lru_cache
+import discord
+import pytz
+from guild_config import zone_label
+
+TIME_FORMAT = "%A\n%d/%m/%Y\n%I:%M %p"
+
+
+@lru_cache(maxsize=None)
+def get_timezone(name: str):
+    """
+    pytz.timezone builds a new object every call, this keeps one per zone
+
+    Args:
+        name (str): zone name, EG: 'US/Eastern'
+
+    Returns:
+        tzinfo: the zone
+    """
+    return pytz.timezone(name)
+
+
+class Renderer:
+    """
+    Builds the embeds the bot sends, caching whatever only depends on a guild's settings
+
+    Each guild's cache is keyed on the settings it was built from, so changing a
+    setting just means the next render misses and rebuilds
+    """
+
+    def __init__(self, prompt_str: str, commands):
+        """
+        Args:
+            prompt_str (str): prompt format string, {0}-{2} are days/hours/minutes,
+                {3} the threshold and {4} the emoji
+            commands (CommandRegistry): the bot's commands, for the help text
+        """
+        self.prompt_str = prompt_str
+        self.commands = commands
+        # guild id -> (settings key, cached stuff)
+        self.__help = {}
+        self.__prompts = {}
+
+    def help_embed(self, config) -> discord.Embed:
+        """
+        Args:
+            config (GuildConfig): guild asking for help
+
+        Returns:
+            discord.Embed: the list of commands
+        """
+        key = config.base_command
+        cached = self.__help.get(config.guild_id)
+        if cached and cached[0] == key:
+            return cached[1]
+        desc = "\n\n".join(
+            config.base_command + " " + command.usage() + "\n\t" + command.help
+            for command in list(self.commands.commands.values()) + [self.commands.default]
+        )
+        embed_var = discord.Embed(title="Commands", description=desc)
+        self.__help[config.guild_id] = (key, embed_var)
+        return embed_var
+
+    def prompt_embed(self, config, delta, deadline: datetime) -> discord.Embed:
+        """
+        Args:
+            config (GuildConfig): guild the event is for
+            delta (timedelta): how far away the event is
+            deadline (datetime): when the event is, timezone aware
+
+        Returns:
+            discord.Embed: the prompt people react to
+        """
+        key = (config.threshold, config.reaction_str, tuple(tuple(zone) for zone in config.timezones))
+        cached = self.__prompts.get(config.guild_id)
+        if not cached or cached[0] != key:
+            # only the days/hours/minutes are left to fill in
+            template = self.prompt_str.replace('{3}', str(config.threshold)).replace('{4}', config.reaction_str)
+            zones = [(label, get_timezone(name)) for label, name in config.timezones]
+            cached = self.__prompts[config.guild_id] = (key, template, zones)
+        _, template, zones = cached
+        embed_var = discord.Embed(
+            title="Let's Play!",
+            description=template.format(
+                delta.days,
+                int(delta.seconds / (60 * 60)),
+                int(delta.seconds / 60) % 60))
+        for label, zone in zones:
+            embed_var.add_field(name=label, value=deadline.astimezone(zone).strftime(TIME_FORMAT))
+        return embed_var
+
+    def forget(self, guild_id: int):
+        """
+        Drops a guild's cached renders (EG: the bot left the guild)
+        """
+        self.__help.pop(guild_id, None)
+        self.__prompts.pop(guild_id, None)
+
+
+def zone_list(arg: str) -> list:
+    """
+    Converter for a space or comma separated list of zone names
+
+    Args:
+        arg (str): EG: 'America/New_York, Europe/London'
+
+    Returns:
+        list: [label, zone name] pairs
+    """
+    zones = []
+    for name in re.split(r'[\s,]+', arg.strip()):
+        try:
+            get_timezone(name)
+        except pytz.UnknownTimeZoneError:
+            raise ValueError("unknown timezone " + name)
+        zones.append([zone_label(name), name])
+    return zones
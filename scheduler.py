@@ -0,0 +1,104 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+
+class Scheduler:
+    """
+    One timer for the whole bot
+
+    Instead of every ReactiveMessage sleeping on its own, anything that needs
+    to happen later gets pushed onto a heap keyed by its absolute deadline and
+    a single task sleeps until the soonest one is due
+    """
+
+    def __init__(self):
+        self.__heap = []
+        self.__counter = itertools.count()
+        self.__live = 0
+        self.__wakeup = None
+        self.__task = None
+
+    def start(self):
+        """
+        Starts the scheduling task on the running event loop
+
+        Safe to call more than once (EG: 'on_ready' after a reconnect)
+        """
+        if self.__task and not self.__task.done():
+            return
+        self.__wakeup = asyncio.Event()
+        self.__task = asyncio.get_event_loop().create_task(self.__run())
+
+    def schedule(self, deadline: float, callback) -> list:
+        """
+        Queues a callback to be run at a certain time
+
+        Args:
+            deadline (float): epoch time in seconds, same clock as time.time()
+            callback: coroutine function that takes no arguments
+
+        Returns:
+            list: handle for `cancel` and `reschedule`
+        """
+        entry = [deadline, next(self.__counter), callback]
+        heapq.heappush(self.__heap, entry)
+        self.__live += 1
+        if self.__heap[0] is entry and self.__wakeup:
+            # new soonest deadline, the timer has to wake up earlier than planned
+            self.__wakeup.set()
+        return entry
+
+    def cancel(self, entry: list):
+        """
+        Stops a scheduled callback from running
+
+        The entry is left on the heap and simply skipped when it comes up,
+        cancelling one that already fired does nothing
+
+        Args:
+            entry (list): handle returned by `schedule`
+        """
+        if entry and entry[2] is not None:
+            entry[2] = None
+            self.__live -= 1
+
+    def reschedule(self, entry: list, deadline: float) -> list:
+        """
+        Moves a scheduled callback to a new deadline
+
+        Args:
+            entry (list): handle returned by `schedule`
+            deadline (float): new epoch time in seconds
+
+        Returns:
+            list: the new handle, None if the callback already fired or was cancelled
+        """
+        callback = entry[2]
+        if callback is None:
+            return None
+        self.cancel(entry)
+        return self.schedule(deadline, callback)
+
+    def __len__(self) -> int:
+        return self.__live
+
+    async def __run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            now = time.time()
+            while self.__heap and (self.__heap[0][2] is None or self.__heap[0][0] <= now):
+                entry = heapq.heappop(self.__heap)
+                callback = entry[2]
+                # the handle may still be held until the task starts, cancelling it then has to be a no-op
+                entry[2] = None
+                if callback is not None:
+                    self.__live -= 1
+                    loop.create_task(callback())
+            timeout = self.__heap[0][0] - now if self.__heap else None
+            self.__wakeup.clear()
+            try:
+                await asyncio.wait_for(self.__wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,359 @@
+import os
+import json
+import pickle
+import sqlite3
+import glob
+from datetime import datetime
+from functools import lru_cache
+from os import path
+from threading import Lock
+import pytz
+from message_manager import BOT_TIME_ZONE
+
+# layout of `PlayBot.get_bot_info` and the save files, saves without a 'version' are 1
+SCHEMA_VERSION = 2
+# what's in a saved running message, in order, EG: `ReactiveMessage.to_record`
+# records are plain tuples so loading them is only unpickling, nothing gets parsed
+EVENT_FIELDS = ('msg_id', 'guild_id', 'channel_id', 'deadline', 'threshold', 'passed', 'reaction', 'success', 'failed')
+# what's in a saved recurring event, in order, EG: `RecurringRule.to_record`
+RULE_FIELDS = ('rule_id', 'guild_id', 'channel_id', 'weekdays', 'every_days', 'hour', 'minute', 'zone', 'next_at')
+# version 1 saves stamped messages with when they were saved, in BOT_TIME_ZONE
+LEGACY_FORMAT = "%d/%m/%y %H:%M:%S"
+
+CONFIG_KEYS = [
+    'permitted_roles',
+    'timezones',
+    'threshold',
+    'base_command',
+    'reaction_str',
+    'pinging',
+    'save_timer',
+    'max_event_time',
+    'max_open_events',
+    'rehydrate_concurrency',
+    'rehydrate_window',
+    'ping_batch_window'
+]
+
+
+def shard_file(file: str, shard_id: int, shard_count: int) -> str:
+    """
+    Name of one shard's save file, EG: './bot_stuff.p' -> './bot_stuff.2-of-4.p'
+
+    Args:
+        file (str): the unsharded save file
+        shard_id (int): which shard
+        shard_count (int): how many shards there are, None for the unsharded file
+    """
+    if shard_count is None:
+        return file
+    root, ext = path.splitext(file)
+    return root + '.' + str(shard_id) + '-of-' + str(shard_count) + ext
+
+
+def layout_files(file: str) -> list:
+    """
+    Every save file on disk for any shard layout, sharded or not
+
+    Args:
+        file (str): the unsharded save file
+    """
+    root, ext = path.splitext(file)
+    files = sorted(glob.glob(glob.escape(root) + '.*-of-*' + ext))
+    if path.exists(file):
+        files.insert(0, file)
+    return files
+
+
+def migrate(dictionary: dict) -> dict:
+    """
+    Brings a loaded save up to SCHEMA_VERSION
+
+    Args:
+        dictionary (dict): straight out of a save file, can be None
+
+    Returns:
+        dict: the same save in the current layout
+    """
+    if not dictionary or dictionary.get('version', 1) >= SCHEMA_VERSION:
+        return dictionary
+    dictionary = dict(dictionary)
+    # messages that never got posted were saved as empty dictionaries
+    dictionary['running_msgs'] = [legacy_event(ref) for ref in dictionary.get('running_msgs', []) if ref]
+    dictionary['version'] = SCHEMA_VERSION
+    return dictionary
+
+
+@lru_cache(maxsize=64)
+def legacy_stamp(stamp: str) -> float:
+    """
+    Reads a version 1 'offline_since' stamp, cached since a whole file gets stamped at once
+
+    Returns:
+        float: epoch time in seconds
+    """
+    # the stamp was written in BOT_TIME_ZONE, so it has to be read in it too, not in local time
+    return pytz.timezone(BOT_TIME_ZONE).localize(datetime.strptime(stamp, LEGACY_FORMAT)).timestamp()
+
+
+def legacy_event(ref: dict) -> tuple:
+    """
+    Turns a version 1 running message dictionary into a record
+
+    Args:
+        ref (dict): saved message, with a 'delay' counted from 'offline_since' or a 'deadline'
+
+    Returns:
+        tuple: fields in EVENT_FIELDS order
+    """
+    if 'deadline' in ref:
+        deadline = ref['deadline']
+    else:
+        deadline = legacy_stamp(ref['offline_since']) + ref['delay']
+    return (
+        ref['msg_id'],
+        ref['guild_id'],
+        ref['channel_id'],
+        deadline,
+        ref['threshold'],
+        ref['passed'],
+        ref['reaction'],
+        ref['success'],
+        ref['failed']
+    )
+
+
+EVENT_SELECT = "SELECT " + ", ".join(EVENT_FIELDS) + " FROM events"
+RULE_SELECT = "SELECT " + ", ".join(RULE_FIELDS) + " FROM recurring"
+
+
+class PickleStore:
+    """
+    The original save file, every save rewrites the whole thing
+    """
+    incremental = False
+
+    def __init__(self, file: str):
+        self.file = file
+
+    def load(self) -> dict:
+        """
+        Returns:
+            dict: everything from `PlayBot.get_bot_info`, None if there's no save file
+        """
+        if not path.exists(self.file):
+            return None
+        with open(self.file, 'rb') as f:
+            return migrate(pickle.load(f))
+
+    def save(self, dictionary: dict) -> list:
+        """
+        Writes to a temporary file and swaps it in, so a crash mid-write
+        leaves the previous save intact
+
+        Args:
+            dictionary (dict): everything from `PlayBot.get_bot_info`
+
+        Returns:
+            list: records that couldn't be written, always empty here
+        """
+        temp = self.file + '.tmp'
+        with open(temp, 'wb') as f:
+            pickle.dump(dictionary, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, self.file)
+        return []
+
+    def size(self) -> int:
+        """
+        Returns:
+            int: bytes on disk, 0 if there's no save file
+        """
+        return path.getsize(self.file) if path.exists(self.file) else 0
+
+    def close(self):
+        pass
+
+
+class SQLiteStore:
+    """
+    SQLite save file with a row per config value, a row per guild, a row per running message
+    and a row per recurring event
+
+    Saves are incremental, only what changed gets written
+    """
+    incremental = True
+
+    def __init__(self, file: str):
+        self.file = file
+        self.__lock = Lock()
+        # saves run on a worker thread, every access goes through the lock
+        self.__conn = sqlite3.connect(file, check_same_thread=False)
+        with self.__conn:
+            self.__conn.execute(
+                "CREATE TABLE IF NOT EXISTS config ("
+                "key TEXT PRIMARY KEY, "
+                "value TEXT NOT NULL)"
+            )
+            self.__conn.execute(
+                "CREATE TABLE IF NOT EXISTS guild_config ("
+                "guild_id INTEGER PRIMARY KEY, "
+                "threshold INTEGER NOT NULL, "
+                "pinging TEXT NOT NULL, "
+                "reaction_str TEXT NOT NULL, "
+                "base_command TEXT NOT NULL, "
+                "permitted_roles TEXT NOT NULL, "
+                "timezones TEXT)"
+            )
+            columns = [row[1] for row in self.__conn.execute("PRAGMA table_info(guild_config)")]
+            if 'timezones' not in columns:
+                # databases from before per-guild timezones
+                self.__conn.execute("ALTER TABLE guild_config ADD COLUMN timezones TEXT")
+            self.__conn.execute(
+                "CREATE TABLE IF NOT EXISTS events ("
+                "msg_id INTEGER PRIMARY KEY, "
+                "guild_id INTEGER NOT NULL, "
+                "channel_id INTEGER NOT NULL, "
+                "deadline REAL NOT NULL, "
+                "threshold INTEGER NOT NULL, "
+                "passed INTEGER NOT NULL, "
+                "reaction TEXT NOT NULL, "
+                "success TEXT NOT NULL, "
+                "failed TEXT NOT NULL)"
+            )
+            self.__conn.execute("CREATE INDEX IF NOT EXISTS events_deadline ON events (deadline)")
+            self.__conn.execute(
+                "CREATE TABLE IF NOT EXISTS recurring ("
+                "rule_id INTEGER PRIMARY KEY, "
+                "guild_id INTEGER NOT NULL, "
+                "channel_id INTEGER NOT NULL, "
+                "weekdays INTEGER NOT NULL, "
+                "every_days INTEGER NOT NULL, "
+                "hour INTEGER NOT NULL, "
+                "minute INTEGER NOT NULL, "
+                "zone TEXT NOT NULL, "
+                "next_at REAL NOT NULL)"
+            )
+
+    def load(self) -> dict:
+        """
+        Returns:
+            dict: same layout as `PlayBot.get_bot_info`, None if the database is empty
+        """
+        with self.__lock:
+            config = self.__conn.execute("SELECT key, value FROM config").fetchall()
+            guilds = self.__conn.execute("SELECT guild_id, threshold, pinging, reaction_str, base_command, permitted_roles, timezones FROM guild_config").fetchall()
+            # rows come out in EVENT_FIELDS order, so they're records as they are
+            events = self.__conn.execute(EVENT_SELECT + " ORDER BY deadline").fetchall()
+            rules = self.__conn.execute(RULE_SELECT).fetchall()
+        if not config and not guilds and not events and not rules:
+            return None
+        dictionary = {key: json.loads(value) for key, value in config}
+        dictionary['version'] = SCHEMA_VERSION
+        dictionary['guilds'] = [self.__guild_from_row(row) for row in guilds]
+        dictionary['running_msgs'] = events
+        dictionary['recurring'] = rules
+        return dictionary
+
+    def save(self, dictionary: dict) -> list:
+        """
+        Writes only what's in the dictionary, a record the database won't take
+        is left out instead of failing everything else with it
+
+        Args:
+            dictionary (dict): any of the config keys, 'guilds' with the guild settings
+                to insert/update, 'running_msgs' with the messages to insert/update
+                and 'removed_msgs' with ids of messages to delete, 'recurring' and
+                'removed_recurring' are the same for recurring events
+
+        Returns:
+            list: running message and recurring event records that were left out
+        """
+        config = [(key, json.dumps(dictionary[key])) for key in CONFIG_KEYS if key in dictionary]
+        guilds = [self.__guild_to_row(guild) for guild in dictionary.get('guilds', [])]
+        events = [rmsg for rmsg in dictionary.get('running_msgs', []) if rmsg]
+        removed = [(msg_id,) for msg_id in dictionary.get('removed_msgs', [])]
+        rules = dictionary.get('recurring', [])
+        removed_rules = [(rule_id,) for rule_id in dictionary.get('removed_recurring', [])]
+        rejected = []
+        with self.__lock, self.__conn:
+            if config:
+                self.__conn.executemany("INSERT OR REPLACE INTO config VALUES (?, ?)", config)
+            if guilds:
+                self.__conn.executemany("INSERT OR REPLACE INTO guild_config VALUES (?, ?, ?, ?, ?, ?, ?)", guilds)
+            if events:
+                rejected.extend(self.__write_records("INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", events))
+            if removed:
+                self.__conn.executemany("DELETE FROM events WHERE msg_id = ?", removed)
+            if rules:
+                rejected.extend(self.__write_records("INSERT OR REPLACE INTO recurring VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rules))
+            if removed_rules:
+                self.__conn.executemany("DELETE FROM recurring WHERE rule_id = ?", removed_rules)
+        return rejected
+
+    def __write_records(self, statement: str, records: list) -> list:
+        """
+        Helper that writes records in one go, or one by one if any of them breaks a constraint
+
+        Returns:
+            list: the records that broke a constraint
+        """
+        try:
+            self.__conn.executemany(statement, records)
+            return []
+        except sqlite3.IntegrityError:
+            # the ones before the bad record already went in, writing them again only replaces them
+            rejected = []
+            for record in records:
+                try:
+                    self.__conn.execute(statement, record)
+                except sqlite3.IntegrityError:
+                    rejected.append(record)
+            return rejected
+
+    def size(self) -> int:
+        """
+        Returns:
+            int: bytes on disk, 0 if there's no database
+        """
+        return path.getsize(self.file) if path.exists(self.file) else 0
+
+    def close(self):
+        with self.__lock:
+            self.__conn.close()
+
+    def events_due_before(self, deadline: float) -> list:
+        """
+        Args:
+            deadline (float): epoch time in seconds
+
+        Returns:
+            list: saved message records due before the deadline, soonest first
+        """
+        with self.__lock:
+            return self.__conn.execute(
+                EVENT_SELECT + " WHERE deadline < ? ORDER BY deadline", (deadline,)
+            ).fetchall()
+
+    def __guild_to_row(self, guild: dict) -> tuple:
+        return (
+            guild['guild_id'],
+            guild['threshold'],
+            json.dumps(guild['pinging']),
+            guild['reaction_str'],
+            guild['base_command'],
+            json.dumps(guild['permitted_roles']),
+            json.dumps(guild['timezones'])
+        )
+
+    def __guild_from_row(self, row: tuple) -> dict:
+        return {
+            'guild_id': row[0],
+            'threshold': row[1],
+            'pinging': json.loads(row[2]),
+            'reaction_str': row[3],
+            'base_command': row[4],
+            'permitted_roles': json.loads(row[5]),
+            'timezones': json.loads(row[6]) if row[6] else None
+        }
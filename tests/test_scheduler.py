@@ -0,0 +1,49 @@
+import asyncio
+import time
+import unittest
+from scheduler import Scheduler
+
+
+class SchedulerTest(unittest.TestCase):
+
+    def test_fired_handle_is_inert(self):
+        calls = []
+
+        async def main():
+            scheduler = Scheduler()
+            scheduler.start()
+
+            async def callback():
+                calls.append(time.time())
+            entry = scheduler.schedule(time.time(), callback)
+            # long enough for the entry to be popped, the callback's task may not have run yet
+            await asyncio.sleep(0.05)
+            scheduler.cancel(entry)
+            self.assertIsNone(scheduler.reschedule(entry, time.time()))
+            self.assertEqual(len(scheduler), 0)
+            await asyncio.sleep(0.05)
+
+        asyncio.run(main())
+        self.assertEqual(len(calls), 1)
+
+    def test_cancel_before_firing(self):
+        calls = []
+
+        async def main():
+            scheduler = Scheduler()
+            scheduler.start()
+
+            async def callback():
+                calls.append(time.time())
+            entry = scheduler.schedule(time.time() + 0.02, callback)
+            scheduler.cancel(entry)
+            scheduler.cancel(entry)
+            self.assertEqual(len(scheduler), 0)
+            await asyncio.sleep(0.05)
+
+        asyncio.run(main())
+        self.assertEqual(calls, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import os
+import tempfile
+import unittest
+from storage import SQLiteStore
+
+
+def event(msg_id: int, guild_id: int = 1) -> tuple:
+    return (msg_id, guild_id, 2, 1000.0, 3, False, '👍', 'success', 'failed')
+
+
+class SQLiteStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.store = SQLiteStore(os.path.join(self.dir.name, 'bot_stuff.db'))
+
+    def tearDown(self):
+        self.store.close()
+        self.dir.cleanup()
+
+    def test_bad_record_does_not_block_the_batch(self):
+        # a DM event has no guild, which the events table won't take
+        rejected = self.store.save({'running_msgs': [event(10), event(11, None), event(12)]})
+        self.assertEqual(rejected, [event(11, None)])
+        saved = self.store.load()['running_msgs']
+        self.assertEqual(sorted(record[0] for record in saved), [10, 12])
+
+    def test_next_save_goes_through(self):
+        self.store.save({'running_msgs': [event(10, None)]})
+        self.assertEqual(self.store.save({'running_msgs': [event(12)], 'removed_msgs': [10]}), [])
+        self.assertEqual([record[0] for record in self.store.load()['running_msgs']], [12])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,327 @@
+import time
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timezone
+import discord
+from command_parser import duration
+
+# past this many drops at once, the sorted indexes get rebuilt instead of edited one by one
+REBUILD_AFTER = 64
+
+
+class EventSelector:
+    """
+    Which running messages an admin command applies to
+
+    Every part that's set has to match, anything left as None matches everything
+    """
+
+    def __init__(
+            self,
+            msg_ids: set = None,
+            channel_id: int = None,
+            guild_id: int = None,
+            due_within: float = None,
+            older_than: float = None,
+            page: int = 1
+        ):
+        """
+        Args:
+            msg_ids (set): discord message ids
+            channel_id (int): channel the messages were posted in
+            guild_id (int): guild the messages were posted in
+            due_within (float): seconds, only messages whose deadline is at most this far away
+            older_than (float): seconds, only messages posted at least this long ago
+            page (int): which page to show when listing
+        """
+        # set by `all`, so matching everything has to be asked for
+        self.everything = False
+        self.msg_ids = msg_ids
+        self.channel_id = channel_id
+        self.guild_id = guild_id
+        self.due_within = due_within
+        self.older_than = older_than
+        self.page = page
+
+    def is_empty(self) -> bool:
+        """
+        Returns:
+            bool: True when nothing at all was asked for, not even `all`
+        """
+        return not self.everything and (
+            self.msg_ids is None and self.channel_id is None and self.guild_id is None and
+            self.due_within is None and self.older_than is None
+        )
+
+
+def event_selector(arg: str) -> EventSelector:
+    """
+    Converter for message ids and filters, EG: '123 456' or 'guild=789 due=30'
+
+    Filters are `channel=<id>`, `guild=<id>`, `due=<time>` and `older=<time>` where
+    the times are 'd:h:m', 'h:m' or 'm' like `duration`, `page=<n>` picks a page for
+    listing and `all` matches every running message
+
+    Args:
+        arg (str): space separated ids and filters
+
+    Returns:
+        EventSelector: what was asked for
+    """
+    selector = EventSelector()
+    for word in arg.split():
+        key, _, value = word.partition('=')
+        if word == 'all':
+            selector.everything = True
+        elif not value:
+            selector.msg_ids = (selector.msg_ids or set()) | {int(word)}
+        elif key == 'channel':
+            selector.channel_id = int(value)
+        elif key == 'guild':
+            selector.guild_id = int(value)
+        elif key == 'due':
+            selector.due_within = duration(value).total_seconds()
+        elif key == 'older':
+            selector.older_than = duration(value).total_seconds()
+        elif key == 'page':
+            selector.page = max(1, int(value))
+        else:
+            raise ValueError("unknown filter " + key)
+    return selector
+
+
+class EventTracker:
+    """
+    Keeps track of every running ReactiveMessage by its message id
+
+    Messages that haven't been posted yet don't have an id, so they sit in a
+    pending set until they tell the tracker they've been posted.
+    Finished messages are only flagged when they complete and get dropped
+    all at once with `prune`
+
+    Posted messages are also indexed by channel, guild, deadline and id
+    (ids are snowflakes, so sorting them sorts by when they were posted)
+    so `select` never has to walk every message
+    """
+
+    def __init__(self, on_change=None):
+        """
+        Args:
+            on_change: optional callable taking a message id, called whenever the
+                saveable state of a message changes (posted, completed or removed)
+        """
+        self.__events = {}
+        self.__pending = set()
+        self.__completed = set()
+        self.__on_change = on_change
+        # channel id/guild id -> set of message ids
+        self.__by_channel = {}
+        self.__by_guild = {}
+        # sorted (deadline, message id)
+        self.__deadlines = []
+        # sorted message ids, oldest first
+        self.__ids = []
+
+    def __changed(self, msg_id: int):
+        if self.__on_change:
+            self.__on_change(msg_id)
+
+    def add(self, rmsg):
+        """
+        Starts tracking a message
+
+        Args:
+            rmsg (ReactiveMessage): message to track
+        """
+        if rmsg.msg_id is None:
+            self.__pending.add(rmsg)
+        else:
+            self.__events[rmsg.msg_id] = rmsg
+            self.__index(rmsg)
+            if rmsg.is_complete():
+                self.__completed.add(rmsg.msg_id)
+
+    def posted(self, rmsg):
+        """
+        Called by a message once it has been sent and has an id
+
+        Args:
+            rmsg (ReactiveMessage): message that was just posted
+        """
+        self.__pending.discard(rmsg)
+        self.__events[rmsg.msg_id] = rmsg
+        self.__index(rmsg)
+        self.__changed(rmsg.msg_id)
+
+    def rescheduled(self, rmsg, old_deadline: float):
+        """
+        Called by a message after its deadline moved
+
+        Args:
+            rmsg (ReactiveMessage): message that was rescheduled
+            old_deadline (float): the deadline it was indexed under
+        """
+        if self.__events.get(rmsg.msg_id) is rmsg:
+            self.__unsort(self.__deadlines, (old_deadline, rmsg.msg_id))
+            insort(self.__deadlines, (rmsg.deadline, rmsg.msg_id))
+
+    def completed(self, rmsg):
+        """
+        Called by a message once it has passed or failed
+
+        Args:
+            rmsg (ReactiveMessage): message that just finished
+        """
+        if rmsg.msg_id is None:
+            self.__pending.discard(rmsg)
+        else:
+            self.__completed.add(rmsg.msg_id)
+            self.__changed(rmsg.msg_id)
+
+    def get(self, msg_id: int):
+        """
+        Looks up a running message
+
+        Args:
+            msg_id (int): discord message id
+
+        Returns:
+            ReactiveMessage: the message or None if it isn't running
+        """
+        if msg_id in self.__completed:
+            return None
+        return self.__events.get(msg_id)
+
+    def remove(self, msg_id: int):
+        """
+        Stops tracking a message
+
+        Args:
+            msg_id (int): discord message id
+
+        Returns:
+            ReactiveMessage: the removed message or None
+        """
+        self.__completed.discard(msg_id)
+        rmsg = self.__events.pop(msg_id, None)
+        if rmsg:
+            self.__unindex(rmsg)
+            self.__changed(msg_id)
+        return rmsg
+
+    def prune(self) -> int:
+        """
+        Drops every completed message in one go
+
+        Returns:
+            int: how many were dropped
+        """
+        rebuild = len(self.__completed) > REBUILD_AFTER
+        for msg_id in self.__completed:
+            rmsg = self.__events.pop(msg_id, None)
+            if rmsg:
+                self.__unindex(rmsg, sorted_indexes=not rebuild)
+        if rebuild:
+            self.__deadlines = sorted((rmsg.deadline, msg_id) for msg_id, rmsg in self.__events.items())
+            self.__ids = sorted(self.__events)
+        dropped = len(self.__completed)
+        self.__completed = set()
+        return dropped
+
+    def select(self, selector: EventSelector) -> list:
+        """
+        Finds every running message a selector matches
+
+        Each filter only narrows down what the ones before it left,
+        so only ids and a channel or guild get looked at one by one
+
+        Args:
+            selector (EventSelector): ids and filters to match
+
+        Returns:
+            list: matching ReactiveMessages, soonest deadline first
+        """
+        now = time.time()
+        candidates = None
+        if selector.msg_ids is not None:
+            candidates = set(selector.msg_ids)
+        for index, key in ((self.__by_channel, selector.channel_id), (self.__by_guild, selector.guild_id)):
+            if key is not None:
+                ids = index.get(key, ())
+                candidates = set(ids) if candidates is None else candidates.intersection(ids)
+        if selector.due_within is not None:
+            end = bisect_right(self.__deadlines, (now + selector.due_within, float('inf')))
+            if candidates is None:
+                candidates = {msg_id for _, msg_id in self.__deadlines[:end]}
+            else:
+                candidates = {msg_id for msg_id in candidates if self.__is_due(msg_id, now + selector.due_within)}
+        if selector.older_than is not None:
+            cutoff = discord.utils.time_snowflake(
+                datetime.fromtimestamp(now - selector.older_than, tz=timezone.utc))
+            if candidates is None:
+                candidates = set(self.__ids[:bisect_left(self.__ids, cutoff)])
+            else:
+                candidates = {msg_id for msg_id in candidates if msg_id < cutoff}
+        if candidates is None:
+            candidates = self.__events.keys()
+        completed = self.__completed
+        rmsgs = [
+            self.__events[msg_id] for msg_id in candidates
+            if msg_id in self.__events and msg_id not in completed
+        ]
+        rmsgs.sort(key=lambda rmsg: rmsg.deadline)
+        return rmsgs
+
+    def open_in_guild(self, guild_id: int) -> int:
+        """
+        Args:
+            guild_id (int): guild to count
+
+        Returns:
+            int: running messages in the guild, posted or not
+        """
+        completed = self.__completed
+        posted = sum(1 for msg_id in self.__by_guild.get(guild_id, ()) if msg_id not in completed)
+        return posted + sum(1 for rmsg in self.__pending if rmsg.guild_id == guild_id)
+
+    def __is_due(self, msg_id: int, until: float) -> bool:
+        rmsg = self.__events.get(msg_id)
+        return rmsg is not None and rmsg.deadline <= until
+
+    def __index(self, rmsg):
+        self.__by_channel.setdefault(rmsg.channel_id, set()).add(rmsg.msg_id)
+        self.__by_guild.setdefault(rmsg.guild_id, set()).add(rmsg.msg_id)
+        insort(self.__deadlines, (rmsg.deadline, rmsg.msg_id))
+        if self.__ids and self.__ids[-1] < rmsg.msg_id:
+            # new messages are the newest, so this is nearly always an append
+            self.__ids.append(rmsg.msg_id)
+        else:
+            insort(self.__ids, rmsg.msg_id)
+
+    def __unindex(self, rmsg, sorted_indexes: bool = True):
+        for index, key in ((self.__by_channel, rmsg.channel_id), (self.__by_guild, rmsg.guild_id)):
+            ids = index.get(key)
+            if ids is not None:
+                ids.discard(rmsg.msg_id)
+                if not ids:
+                    del index[key]
+        if sorted_indexes:
+            self.__unsort(self.__deadlines, (rmsg.deadline, rmsg.msg_id))
+            self.__unsort(self.__ids, rmsg.msg_id)
+
+    def __unsort(self, index: list, item):
+        """
+        Helper that takes one item out of a sorted list
+        """
+        i = bisect_left(index, item)
+        if i < len(index) and index[i] == item:
+            del index[i]
+
+    def __iter__(self):
+        completed = self.__completed
+        return iter([rmsg for msg_id, rmsg in self.__events.items() if msg_id not in completed])
+
+    def __len__(self) -> int:
+        return len(self.__events) - len(self.__completed) + len(self.__pending)
+
+    def __contains__(self, msg_id: int) -> bool:
+        return self.get(msg_id) is not None